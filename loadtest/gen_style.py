@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# loadtest/gen_style.py
+"""
+Génère un style synthétique (.sty) pour les tests de charge.
+
+Le fichier contient un SMF type 1 avec les marqueurs de sections attendus par
+extract_all_sections.py (Intro / Main / Fill In / Ending), des parties sur les
+canaux de style (CH9..CH16 : rythme, basse, accords, pad, phrases), suivi d'un
+chunk CASM minimal. Déterministe pour une graine donnée.
+
+Usage :
+  python3 gen_style.py out.sty --seed 3 [--bars 4] [--density 2] [--sections all|mains]
+Sortie JSON (stdout) : {"file", "tempo", "sections", "bytes"}
+"""
+import argparse, json, os, random, struct, sys
+from mido import MidiFile, MidiTrack, Message, MetaMessage, bpm2tempo
+
+LETTERS = "ABCD"
+TPB = 480
+
+# (canal 0-based, programme, bank MSB)
+PARTS = {
+    "rhythm": (9, 0, 127),
+    "bass":   (10, 33, 0),
+    "chord1": (11, 4, 0),
+    "chord2": (12, 25, 0),
+    "pad":    (13, 48, 0),
+    "phrase": (14, 61, 0),
+}
+CHORD = (60, 64, 67, 71)           # CMaj7, accord source des styles Yamaha
+BASS = (36, 43)
+DRUMS = {"kick": 36, "snare": 38, "hat": 42}
+
+def section_layout(bars, which):
+    layout = []
+    if which == "all":
+        layout += [(f"Intro {l}", 2) for l in LETTERS]
+    layout += [(f"Main {l}", bars) for l in LETTERS]
+    layout += [(f"Fill In {l}{l}", 1) for l in LETTERS]
+    if which == "all":
+        layout += [(f"Ending {l}", 2) for l in LETTERS]
+    return layout
+
+def bar_events(rng, bar_start, variant, density):
+    """[(tick, Message)] pour une mesure 4/4."""
+    ev = []
+    step = TPB // max(1, density)
+    def note(t, ch, n, vel, dur):
+        ev.append((t, Message("note_on", channel=ch, note=n, velocity=vel)))
+        ev.append((t + dur, Message("note_off", channel=ch, note=n, velocity=0)))
+
+    ch = PARTS["rhythm"][0]
+    for i in range(4 * max(1, density)):
+        t = bar_start + i * step
+        note(t, ch, DRUMS["hat"], 60 + rng.randint(0, 30), step // 2)
+        if i % (2 * density) == 0:
+            note(t, ch, DRUMS["kick"] if (i // (2 * density)) % 2 == 0 else DRUMS["snare"], 100, step // 2)
+
+    note(bar_start, PARTS["bass"][0], BASS[variant % 2], 100, TPB * 2 - 10)
+    note(bar_start + TPB * 2, PARTS["bass"][0], BASS[(variant + 1) % 2], 95, TPB * 2 - 10)
+
+    for beat in range(0, 4, 2 if variant % 2 else 1):
+        for n in CHORD[:3]:
+            note(bar_start + beat * TPB, PARTS["chord1"][0], n, 70, TPB - 20)
+    for n in CHORD:
+        note(bar_start, PARTS["pad"][0], n - 12, 50, TPB * 4 - 10)
+    for i in range(density * 2):
+        note(bar_start + i * (TPB * 2 // density), PARTS["phrase"][0], rng.choice(CHORD) + 12, 80, TPB // 2)
+    return ev
+
+def build_style(seed, bars=4, density=2, which="all"):
+    rng = random.Random(seed)
+    tempo = rng.randint(80, 140)
+    bar = TPB * 4
+
+    meta = MidiTrack()
+    meta.append(MetaMessage("set_tempo", tempo=bpm2tempo(tempo), time=0))
+    meta.append(MetaMessage("time_signature", numerator=4, denominator=4, time=0))
+    meta.append(MetaMessage("marker", text="SFF1", time=0))
+    meta.append(MetaMessage("marker", text="SInt", time=0))
+
+    parts = MidiTrack()
+    for ch, prog, msb in PARTS.values():
+        parts.append(Message("control_change", channel=ch, control=0, value=msb, time=0))
+        parts.append(Message("control_change", channel=ch, control=32, value=0, time=0))
+        parts.append(Message("program_change", channel=ch, program=prog, time=0))
+
+    markers, events = [], []
+    t = bar                                   # mesure d'init (SInt)
+    layout = section_layout(bars, which)
+    for idx, (label, n_bars) in enumerate(layout):
+        markers.append((t, label))
+        for b in range(n_bars):
+            events += bar_events(rng, t + b * bar, idx + b, density)
+        t += n_bars * bar
+
+    last = 0
+    for tick, label in markers:
+        meta.append(MetaMessage("marker", text=label, time=tick - last))
+        last = tick
+    meta.append(MetaMessage("end_of_track", time=t - last))
+
+    last = 0
+    for tick, msg in sorted(events, key=lambda e: (e[0], e[1].type == "note_on")):
+        parts.append(msg.copy(time=tick - last))
+        last = tick
+
+    mf = MidiFile(type=1, ticks_per_beat=TPB)
+    mf.tracks += [meta, parts]
+    return mf, tempo, [label for label, _ in layout]
+
+def casm_chunk(labels):
+    """CASM minimal : une CSEG couvrant toutes les sections, sans Ctab (parts par défaut)."""
+    names = ",".join(labels).encode("latin-1")
+    sdec = b"Sdec" + struct.pack(">I", len(names)) + names
+    cseg = b"CSEG" + struct.pack(">I", len(sdec)) + sdec
+    return b"CASM" + struct.pack(">I", len(cseg)) + cseg
+
+def main():
+    ap = argparse.ArgumentParser(description="Style .sty synthétique pour les tests de charge.")
+    ap.add_argument("out")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--bars", type=int, default=4, help="mesures par Main")
+    ap.add_argument("--density", type=int, default=2, help="subdivisions par temps")
+    ap.add_argument("--sections", choices=("all", "mains"), default="all")
+    args = ap.parse_args()
+
+    mf, tempo, labels = build_style(args.seed, max(1, args.bars), max(1, args.density), args.sections)
+    tmp = args.out + ".mid"
+    mf.save(tmp)
+    with open(tmp, "rb") as f:
+        smf = f.read()
+    os.remove(tmp)
+    with open(args.out, "wb") as f:
+        f.write(smf + casm_chunk(labels))
+    print(json.dumps({"file": args.out, "tempo": tempo, "sections": labels, "bytes": os.path.getsize(args.out)}))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# loadtest/stub_timidity.py
+"""
+Remplaçant de `timidity` pour les tests de charge (installé sous ce nom dans le PATH
+par loadtest/run.js). Accepte la ligne de commande construite par render_xg.py :
+
+  timidity -c <cfg> -Ow -s <sr> -o <wav> [--output-mono ...] -EF... -v <mid>
+
+- écrit un WAV PCM 16-bit : une sinusoïde amortie par note (numpy), longueur
+  du MIDI + 1 s de release → coût CPU proportionnel au contenu, comme un vrai rendu ;
+- affiche le chemin du SF2 lu dans le .cfg (contrôle anti-fallback de render_xg.py).
+"""
+import os, re, sys, wave
+import numpy as np
+from mido import MidiFile
+
+RELEASE_SEC = 1.0
+
+def parse_args(argv):
+    opts = {"sr": 44100, "channels": 2, "cfg": None, "out": None, "mid": None}
+    i = 0
+    while i < len(argv):
+        a = argv[i]
+        if a == "-c":
+            opts["cfg"] = argv[i + 1]; i += 1
+        elif a == "-s":
+            opts["sr"] = int(float(argv[i + 1])); i += 1
+        elif a == "-o":
+            opts["out"] = argv[i + 1]; i += 1
+        elif a == "-p":
+            i += 1
+        elif a == "--output-mono":
+            opts["channels"] = 1
+        elif not a.startswith("-"):
+            opts["mid"] = a
+        i += 1
+    return opts
+
+def render(mid_path, sr, channels):
+    mf = MidiFile(mid_path)
+    notes, held, t = [], {}, 0.0
+    for msg in mf:
+        t += msg.time
+        if msg.type == "note_on" and msg.velocity > 0:
+            held[(msg.channel, msg.note)] = (t, msg.velocity)
+        elif msg.type in ("note_on", "note_off") and (msg.channel, msg.note) in held:
+            start, vel = held.pop((msg.channel, msg.note))
+            notes.append((start, t, msg.note, vel))
+    for (ch, note), (start, vel) in held.items():
+        notes.append((start, t, note, vel))
+
+    out = np.zeros(int((t + RELEASE_SEC) * sr) + 1, np.float32)
+    for start, end, note, vel in notes:
+        a = int(start * sr)
+        n = min(len(out) - a, int((end - start + 0.3) * sr))
+        if n <= 0:
+            continue
+        k = np.arange(n, dtype=np.float32)
+        f = 440.0 * 2 ** ((note - 69) / 12)
+        out[a:a + n] += (vel / 127 * 0.08) * np.sin(2 * np.pi * f * k / sr) * np.exp(-3.0 * k / sr)
+    pcm = (np.clip(out, -1, 1) * 32767).astype("<i2")
+    if channels == 2:
+        pcm = np.repeat(pcm[:, None], 2, axis=1)
+    return pcm
+
+def main():
+    opts = parse_args(sys.argv[1:])
+    if not opts["out"] or not opts["mid"]:
+        print("stub timidity: -o <wav> et <mid> requis", file=sys.stderr)
+        return 2
+    if opts["cfg"] and os.path.isfile(opts["cfg"]):
+        with open(opts["cfg"], encoding="utf-8") as f:
+            m = re.search(r'soundfont\s+"([^"]+)"', f.read())
+        if m:
+            print(f"Opening {m.group(1)}")
+    pcm = render(opts["mid"], opts["sr"], opts["channels"])
+    with wave.open(opts["out"], "wb") as w:
+        w.setnchannels(opts["channels"])
+        w.setsampwidth(2)
+        w.setframerate(opts["sr"])
+        w.writeframes(pcm.tobytes())
+    print(f"Output {opts['out']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
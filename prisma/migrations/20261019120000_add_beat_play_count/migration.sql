@@ -0,0 +1,2 @@
+-- AlterTable
+ALTER TABLE "Beat" ADD COLUMN     "playCount" INTEGER NOT NULL DEFAULT 0;
@@ -8,6 +8,9 @@ const prisma = new PrismaClient();
 const jwt = require('jsonwebtoken');
 const { createClient } = require('@supabase/supabase-js');
 const { uploadFileToSupabaseStorage, deleteFileFromSupabaseStorage } = require('../utils/supabaseStorage');
+const { getArtifactStore } = require('../utils/artifactStore');
+const { getPrepareQueue, PRIORITY } = require('../utils/prepareQueue');
+const manifestCache = require('../utils/manifestCache');
 
 const JWT_SECRET = process.env.JWT_SECRET;
 const supabaseAdmin = createClient(
@@ -118,6 +121,9 @@ router.post('/upload', authMiddleware, upload.single('beat'), async (req, res) =
   beat
 });
 
+    // 🔥 Pré-rendu de fond (basse priorité) : le 1er auditeur n'attend plus l'extraction + rendu
+    getPrepareQueue().enqueue(beat.id, PRIORITY.UPLOAD);
+
   } catch (err) {
     console.error("Erreur enregistrement beat :", err);
     res.status(500).json({ error: 'Erreur serveur', details: err.message });
@@ -147,6 +153,7 @@ router.get('/:id', authMiddleware, async (req, res) => {
     if (!beat || beat.userId !== req.user.userId) {
       return res.status(403).json({ error: 'Accès interdit ou beat introuvable' });
     }
+    getPrepareQueue().promote(beatId); // beat ouvert : son pré-rendu passe devant
 
     const filePath = path.join(uploadDir, beat.filename);
     console.log('Chemin complet du fichier demandé :', filePath);
@@ -209,6 +216,9 @@ router.delete('/:id', authMiddleware, async (req, res) => {
       console.log('ℹ️ Aucun fichier à supprimer dans midiAndWav');
     }
 
+    // Artefacts rendus (niveau chaud local + niveau froid)
+    await getArtifactStore().removeBeat(beatId).catch(e => console.warn('⚠️ Nettoyage artefacts :', e.message));
+
     // 3️⃣ Supprime fichier .sty local si présent
     const filepath = path.join(uploadDir, beat.filename);
     if (fs.existsSync(filepath)) {
@@ -217,6 +227,7 @@ router.delete('/:id', authMiddleware, async (req, res) => {
     }
 
     // 4️⃣ Supprime en base Prisma
+    getPrepareQueue().remove(beatId);
     await prisma.beat.delete({ where: { id: beatId } });
     console.log('🗑️ Beat supprimé en base Prisma');
 
@@ -267,7 +278,13 @@ router.put('/:id', authMiddleware, upload.single('beat'), async (req, res) => {
       data: updateData,
     });
 
+    // Nouveau .sty : l'objet Supabase peut garder le même nom (URL inchangée), cache et temp/ périmés
+    if (req.file) manifestCache.invalidate(beatId);
+
     res.json({ message: 'Beat mis à jour avec succès' });
+
+    // 🔥 Pré-rendu de fond (le manifest en cache est invalidé si fichier / tempo ont changé)
+    getPrepareQueue().enqueue(beatId, PRIORITY.UPLOAD);
   } catch (err) {
     console.error('Erreur mise à jour beat :', err);
     res.status(500).json({ error: 'Erreur serveur', details: err.message });
@@ -331,6 +348,9 @@ router.delete('/:id', authMiddleware, async (req, res) => {
       console.log('ℹ️ Aucun fichier à supprimer dans midiAndWav');
     }
 
+    // Artefacts rendus (niveau chaud local + niveau froid)
+    await getArtifactStore().removeBeat(beatId).catch(e => console.warn('⚠️ Nettoyage artefacts :', e.message));
+
     // 3️⃣ Supprime fichier .sty local si présent
     const filepath = path.join(uploadDir, beat.filename);
     if (fs.existsSync(filepath)) {
@@ -339,6 +359,7 @@ router.delete('/:id', authMiddleware, async (req, res) => {
     }
 
     // 4️⃣ Supprime en base Prisma
+    getPrepareQueue().remove(beatId);
     await prisma.beat.delete({ where: { id: beatId } });
     console.log('🗑️ Beat supprimé en base Prisma');
 
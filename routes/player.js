@@ -1,12 +1,15 @@
 const express = require('express');
 const path = require('path');
 const fs = require('fs');
+const os = require('os');
 const fetch = require('node-fetch');
 const { spawnSync, execSync, spawn } = require('child_process');
 const { PrismaClient } = require('@prisma/client');
 const router = express.Router();
 const prisma = new PrismaClient();
-const { createClient } = require('@supabase/supabase-js');
+const { getArtifactStore } = require('../utils/artifactStore');
+const { getPrepareQueue, PRIORITY } = require('../utils/prepareQueue');
+const manifestCache = require('../utils/manifestCache');
 
 console.log("🚀 routes/player.js chargé");
 
@@ -39,6 +42,16 @@ const FFMPEG_EXE = process.env.FFMPEG_PATH || 'ffmpeg';
 const SF2_PATH = process.env.SF2_PATH || path.join(__dirname, '..', 'soundfonts', 'Yamaha_PSR.sf2');
 // TiMidity only
 const TIMIDITY_EXE = 'timidity';
+// Fréquence des rendus pleine qualité (sections, queues, stems)
+const RENDER_SR = process.env.RENDER_SR || '44100';
+// Rendu parallèle par segments de mesures pour les timelines longues (1 = désactivé).
+// Désactivé par défaut tant que le recollage n'a été mesuré qu'avec le synthé stub :
+// à activer avec RENDER_SEGMENT_VERIFY=1 après contrôle contre le vrai TiMidity (loadtest --real-synth).
+const RENDER_SEGMENTS = parseInt(process.env.RENDER_SEGMENTS || '1', 10) || 1;
+const SEGMENT_ARGS = RENDER_SEGMENTS > 1
+  ? ['--parallel-segments', String(RENDER_SEGMENTS), '--segment-min-sec', process.env.RENDER_SEGMENT_MIN_SEC || '16',
+     ...(process.env.RENDER_SEGMENT_VERIFY === '1' ? ['--segment-verify'] : [])]
+  : [];
 
 if (!fs.existsSync(TEMP_DIR)) fs.mkdirSync(TEMP_DIR, { recursive: true });
 if (!fs.existsSync(UPLOAD_DIR)) fs.mkdirSync(UPLOAD_DIR, { recursive: true });
@@ -291,14 +304,14 @@ function convertMidToWav(midPath, wavPath) {
 
   const preTrimWav = wavPath.replace(/\.wav$/i, '_pretrim.wav');
   const py = path.join(SCRIPTS_DIR, 'render_xg.py');
-  const sr = process.env.RENDER_SR || '44100';
+  const sr = RENDER_SR;
 
   // Flags pour render_xg.py :
   //  - pas d’engine (script timidity-only)
   //  - on demande de NE PAS normaliser via ffmpeg dans le script (on le fait ici)
   const envFlags = (process.env.RENDER_XG_FLAGS || '').trim();
   const extra = envFlags ? envFlags.split(/\s+/).filter(Boolean) : [];
-  const args = [py, midPath, preTrimWav, '--sf2', SF2_PATH, '--sr', sr, '--no-ffmpeg-fix', ...extra];
+  const args = [py, midPath, preTrimWav, '--sf2', SF2_PATH, '--sr', sr, '--no-ffmpeg-fix', ...SEGMENT_ARGS, ...extra];
 
   if (DEBUG_SYNTH) console.log('🔧 CMD render_xg.py:', fmtCmd('python3', args));
   const r = spawnSync('python3', args, { encoding: 'utf-8' });
@@ -326,22 +339,30 @@ function convertMidToWav(midPath, wavPath) {
   console.log(`✅ Conversion + hard trim OK →`, fileInfo(wavPath));
 }
 
-function convertMidToWavAsync(midPath, wavPath) {
+// opts.preview : tier aperçu (PREVIEW_SR mono, polyphonie réduite, sans effets)
+// opts.lowPriority : pré-rendu de fond (nice, sans rendu parallèle par segments)
+const PREVIEW_SR = process.env.PREVIEW_SR || '22050';
+// Aperçus rendus en parallèle (bornés) avant la réponse
+const PREVIEW_CONCURRENCY = parseInt(process.env.PREVIEW_CONCURRENCY || String(Math.min(os.cpus().length, 4)), 10) || 1;
+function convertMidToWavAsync(midPath, wavPath, opts = {}) {
   return new Promise((resolve, reject) => {
-    console.log('🎶 Conversion via render_xg.py (async, TiMidity only)');
+    console.log(`🎶 Conversion via render_xg.py (async, TiMidity only${opts.preview ? ', aperçu' : ''})`);
     console.log('📄 MID :', fileInfo(midPath));
     console.log('🎹 SF2 :', fileInfo(SF2_PATH));
     if (!fs.existsSync(SF2_PATH)) return reject(new Error(`SoundFont introuvable: ${SF2_PATH}`));
 
     const preTrimWav = wavPath.replace(/\.wav$/i, '_pretrim.wav');
     const py = path.join(SCRIPTS_DIR, 'render_xg.py');
-    const sr = process.env.RENDER_SR || '44100';
+    const sr = opts.preview ? PREVIEW_SR : RENDER_SR;
     const envFlags = (process.env.RENDER_XG_FLAGS || '').trim();
     const extra = envFlags ? envFlags.split(/\s+/).filter(Boolean) : [];
-    const args = [py, midPath, preTrimWav, '--sf2', SF2_PATH, '--sr', sr, '--no-ffmpeg-fix', ...extra];
+    if (opts.preview) extra.push('--preview');
+    const args = [py, midPath, preTrimWav, '--sf2', SF2_PATH, '--sr', sr, '--no-ffmpeg-fix',
+      ...(opts.lowPriority ? [] : SEGMENT_ARGS), ...extra];
+    const [bin, binArgs] = opts.lowPriority ? ['nice', ['-n', '10', 'python3', ...args]] : ['python3', args];
 
-    if (DEBUG_SYNTH) console.log('🔧 CMD render_xg.py:', fmtCmd('python3', args));
-    const p = spawn('python3', args);
+    if (DEBUG_SYNTH) console.log('🔧 CMD render_xg.py:', fmtCmd(bin, binArgs));
+    const p = spawn(bin, binArgs);
     let pyOut = '', pyErr = '';
     p.stdout?.on('data', d => pyOut += d.toString());
     p.stderr?.on('data', d => pyErr += d.toString());
@@ -351,12 +372,13 @@ function convertMidToWavAsync(midPath, wavPath) {
       if (pyErr.trim()) console.warn('🐍 render_xg.py stderr:', pyErr.trim());
       if (code !== 0 || !fs.existsSync(preTrimWav)) return reject(new Error(`render_xg.py exit ${code}`));
 
+      // Silence de fin seulement : le début reste au tick 0 (grille de mesures), comme les stems
+      // rendus séparément par renderStemsAsync, qui restent ainsi alignés sur le mix
       const filter =
         'areverse,' +
         'silenceremove=start_periods=1:start_silence=0.35:start_threshold=-50dB,' +
-        'areverse,' +
-        'silenceremove=start_periods=1:start_silence=0.02:start_threshold=-40dB';
-      const fArgs = ['-y','-i', preTrimWav, '-af', filter, '-acodec','pcm_s16le','-ar', sr, wavPath];
+        'areverse';
+      const fArgs = ['-y','-i', preTrimWav, '-af', filter, '-acodec','pcm_s16le','-ar', sr, ...(opts.preview ? ['-ac', '1'] : []), wavPath];
       if (DEBUG_SYNTH) console.log('🔧 CMD (ffmpeg trim):', fmtCmd(FFMPEG_EXE, fArgs));
 
       const ff = spawn(FFMPEG_EXE, fArgs);
@@ -374,12 +396,56 @@ function convertMidToWavAsync(midPath, wavPath) {
   });
 }
 
+// Coupe exacte + pics de forme d'onde (.peaks) dans la même passe sur le PCM final.
+// Repli sur hardTrimToDuration si le script échoue (pas de pics dans ce cas).
+function finalizeWavWithPeaks(wavPath, seconds, sr = RENDER_SR) {
+  const peaksPath = wavPath.replace(/\.wav$/i, '.peaks');
+  const py = path.join(SCRIPTS_DIR, 'finalize_wav.py');
+  const args = [py, wavPath, '--peaks', peaksPath];
+  if (seconds && seconds > 0) args.push('--seconds', `${seconds}`);
+  const r = spawnSync('python3', args, { encoding: 'utf-8' });
+  if (r.status !== 0 || !fs.existsSync(peaksPath)) {
+    console.warn('⚠️ finalize_wav.py a échoué, repli ffmpeg :', r.stderr?.trim());
+    if (seconds && seconds > 0) hardTrimToDuration(wavPath, seconds, sr);
+    return null;
+  }
+  if (DEBUG_SYNTH) console.log('📈 Pics :', fileInfo(peaksPath));
+  return peaksPath;
+}
+
+// Stems groupés (rhythm/bass/chord/pad/phrase) en un seul lot, alignés à l'échantillon
+function renderStemsAsync(midPath, wavPath, seconds) {
+  return new Promise((resolve, reject) => {
+    if (!fs.existsSync(SF2_PATH)) return reject(new Error(`SoundFont introuvable: ${SF2_PATH}`));
+    const py = path.join(SCRIPTS_DIR, 'render_xg.py');
+    const sr = RENDER_SR;
+    const args = [py, midPath, wavPath, '--sf2', SF2_PATH, '--sr', sr, '--stems'];
+    if (seconds && seconds > 0) args.push('--stem-duration', `${seconds}`);
+
+    if (DEBUG_SYNTH) console.log('🔧 CMD render_xg.py (stems):', fmtCmd('python3', args));
+    const p = spawn('python3', args);
+    let pyOut = '', pyErr = '';
+    p.stdout?.on('data', d => pyOut += d.toString());
+    p.stderr?.on('data', d => pyErr += d.toString());
+    p.on('error', reject);
+    p.on('close', code => {
+      if (pyErr.trim()) console.warn('🐍 render_xg.py (stems) stderr:', pyErr.trim());
+      if (code !== 0) return reject(new Error(`render_xg.py --stems exit ${code}`));
+      try {
+        resolve(JSON.parse(pyOut.trim()).stems || []);
+      } catch (e) {
+        reject(new Error('render_xg.py --stems : JSON invalide'));
+      }
+    });
+  });
+}
+
 // Coupe le WAV exactement à la durée souhaitée (petite marge anti-click)
 const TAIL_EARLY_MS = 0.000;
-function hardTrimToDuration(wavPath, seconds) {
+function hardTrimToDuration(wavPath, seconds, sr = RENDER_SR) {
   const out = wavPath.replace(/\.wav$/i, '.tight.wav');
   const target = Math.max(0, Number(seconds) - TAIL_EARLY_MS);
-  const args = ['-y', '-i', wavPath, '-t', `${target}`, '-acodec', 'pcm_s16le', '-ar', '44100', out];
+  const args = ['-y', '-i', wavPath, '-t', `${target}`, '-acodec', 'pcm_s16le', '-ar', String(sr), out];
   const p = spawnSync(FFMPEG_EXE, args, { encoding: 'utf-8' });
   if (p.status !== 0) {
     console.error('ffmpeg -t stderr:', p.stderr);
@@ -388,6 +454,20 @@ function hardTrimToDuration(wavPath, seconds) {
   fs.renameSync(out, wavPath);
 }
 
+// Conserve la queue (release / réverb) que hardTrimToDuration coupe, pour l'assemblage d'arrangements
+const TAIL_MAX_SEC = parseFloat(process.env.TAIL_MAX_SEC || '4');
+function saveReleaseTail(wavPath, seconds, sr = RENDER_SR) {
+  const tailPath = wavPath.replace(/\.wav$/i, '_tail.wav');
+  const args = ['-y', '-i', wavPath, '-ss', `${seconds}`, '-t', `${TAIL_MAX_SEC}`, '-acodec', 'pcm_s16le', '-ar', String(sr), tailPath];
+  const p = spawnSync(FFMPEG_EXE, args, { encoding: 'utf-8' });
+  if (p.status !== 0 || !fs.existsSync(tailPath)) {
+    console.warn('⚠️ Queue de release non extraite :', p.stderr?.trim().split('\n').pop());
+    try { fs.unlinkSync(tailPath); } catch {}
+    return null;
+  }
+  return tailPath;
+}
+
 // --- Routes ---
 
 router.post('/prepare-main', async (req, res) => {
@@ -531,17 +611,20 @@ router.get('/stream', (req, res) => {
 
 router.post('/cleanup', async (req, res) => {
   console.log("➡️ POST /api/player/cleanup appelée");
-  const { beatId } = req.body;
+  // Entier strict : beatId sert à construire des chemins (temp/, cache des manifests)
+  const beatId = /^\d+$/.test(String(req.body.beatId ?? '')) ? parseInt(req.body.beatId, 10) : null;
 
-  if (!beatId) return res.status(400).json({ error: 'beatId est requis' });
+  if (!beatId) return res.status(400).json({ error: 'beatId (entier) est requis' });
 
-  const filesToDelete = fs.readdirSync(TEMP_DIR).filter(f => f.startsWith(String(beatId)));
+  const filesToDelete = fs.readdirSync(TEMP_DIR).filter(f => f.startsWith(`${beatId}_`));
 
   try {
     filesToDelete.forEach(file => {
       const p = path.join(TEMP_DIR, file);
       if (fs.existsSync(p)) fs.unlinkSync(p);
     });
+    forgetChordVariants(beatId);
+    manifestCache.drop(beatId);
     console.log(`🧹 Fichiers temporaires supprimés pour beatId=${beatId}`);
     res.status(200).json({ message: 'Fichiers supprimés' });
   } catch (err) {
@@ -562,14 +645,383 @@ router.get('/list-temps', async (req, res) => {
 
 // --- Préparation + manifest séquenceur (gapless & transitions) ---
 
-const supabase = createClient(
-  process.env.SUPABASE_URL,
-  process.env.SUPABASE_SERVICE_ROLE_KEY
-);
+// Artefacts rendus : disque local (chaud) + bucket midiAndWav (froid), noms = hash du contenu
+const artifacts = getArtifactStore();
+
+// Upload immuable d'un fichier de temp/ → { key, url } (null si échec)
+async function storeArtifact(beatId, filePath, baseUrl) {
+  try {
+    const { key } = await artifacts.putFile(beatId, filePath);
+    return { key, url: artifacts.url(key, baseUrl) };
+  } catch (e) {
+    console.error(`Erreur upload ${path.basename(filePath)}:`, e);
+    return null;
+  }
+}
+
+// Rendu pleine qualité d'une section + upload Supabase → entrée de manifest (null si échec)
+async function renderAndUploadSection(beatId, section, meta, wantStems, baseUrl, renderOpts = {}) {
+  const midPath = path.join(TEMP_DIR, section.midFilename);
+  const wavPath = midPath.replace(/\.mid$/i, '.wav');
+
+  await convertMidToWavAsync(midPath, wavPath, { lowPriority: renderOpts.lowPriority });
+  if (!fs.existsSync(wavPath)) return null;
+
+  // Durée quantifiée sur mesures
+  const midiDur = getMidiDurationSec(midPath);
+  const targetSec = quantizeDurationToBars(midiDur || getWavDurationSec(wavPath), meta.bpm, meta.ts_num);
+  if (targetSec && targetSec > 0) saveReleaseTail(wavPath, targetSec);
+  const peaksPath = finalizeWavWithPeaks(wavPath, targetSec);
+
+  const durationSec = getWavDurationSec(wavPath);
+
+  // Upload MIDI / WAV / pics (.peaks) — repli sur temp/ si l'upload échoue
+  const mid = await storeArtifact(beatId, midPath, baseUrl);
+  const wav = await storeArtifact(beatId, wavPath, baseUrl);
+  const peaks = peaksPath ? await storeArtifact(beatId, peaksPath, baseUrl) : null;
+  const peaksUrl = peaks?.url || null;
+
+  // Stems (optionnel) : même durée exacte que le mix → mixage/mute côté client
+  const stems = [];
+  if (wantStems) {
+    try {
+      for (const st of await renderStemsAsync(midPath, wavPath, targetSec)) {
+        const stemName = path.basename(st.wav);
+        const stored = await storeArtifact(beatId, st.wav, baseUrl);
+        stems.push({
+          group: st.group,
+          channels: st.channels,
+          wavFilename: stemName,
+          wavUrl: stored?.url || `${baseUrl}/temp/${stemName}`
+        });
+      }
+    } catch (e) {
+      console.warn(`⚠️ Stems ${section.sectionName} non rendus :`, e.message);
+    }
+  }
+
+  return {
+    section: section.sectionName,
+    loop: /^Main\s+[ABCD]$/i.test(section.sectionName),
+    oneShot: /^(Fill In\s+[ABCD]{2}|Intro\s+[ABCD]|Ending\s+[ABCD])$/i.test(section.sectionName),
+    midFilename: section.midFilename,
+    midiUrl: mid?.url || `${baseUrl}/temp/${section.midFilename}`,
+    wavFilename: path.basename(wavPath),
+    wavUrl: wav?.url || `${baseUrl}/temp/${path.basename(wavPath)}`,
+    durationSec,
+    bpm: meta.bpm,
+    beatsPerBar: meta.ts_num,
+    ...(peaksUrl ? { peaksUrl } : {}),
+    ...(stems.length ? { stems } : {})
+  };
+}
+
+// Rendu aperçu (22.05 kHz mono, polyphonie réduite, sans effets), servi depuis temp/ sans upload
+async function renderPreviewSection(beatId, section, meta, baseUrl) {
+  const midPath = path.join(TEMP_DIR, section.midFilename);
+  const previewPath = midPath.replace(/\.mid$/i, '_preview.wav');
+  await convertMidToWavAsync(midPath, previewPath, { preview: true });
+  if (!fs.existsSync(previewPath)) return null;
+
+  const targetSec = quantizeDurationToBars(getMidiDurationSec(midPath) || getWavDurationSec(previewPath), meta.bpm, meta.ts_num);
+  finalizeWavWithPeaks(previewPath, targetSec, PREVIEW_SR);
+
+  return {
+    section: section.sectionName,
+    loop: /^Main\s+[ABCD]$/i.test(section.sectionName),
+    oneShot: /^(Fill In\s+[ABCD]{2}|Intro\s+[ABCD]|Ending\s+[ABCD])$/i.test(section.sectionName),
+    quality: 'preview',
+    midFilename: section.midFilename,
+    midiUrl: `${baseUrl}/temp/${section.midFilename}`,
+    wavFilename: path.basename(previewPath),
+    wavUrl: `${baseUrl}/temp/${path.basename(previewPath)}`,
+    durationSec: targetSec || getWavDurationSec(previewPath),
+    bpm: meta.bpm,
+    beatsPerBar: meta.ts_num
+  };
+}
+
+// map() asynchrone à concurrence bornée (ordre des résultats conservé)
+async function mapWithConcurrency(items, limit, fn) {
+  const results = new Array(items.length);
+  let next = 0;
+  const worker = async () => {
+    while (next < items.length) {
+      const i = next++;
+      results[i] = await fn(items[i], i);
+    }
+  };
+  await Promise.all(Array.from({ length: Math.max(1, Math.min(limit, items.length)) }, worker));
+  return results;
+}
+
+function buildManifest(beatId, bpm, tsNum, sections) {
+  const fillMap = {
+    'Main A': 'Fill In AA',
+    'Main B': 'Fill In BB',
+    'Main C': 'Fill In CC',
+    'Main D': 'Fill In DD'
+  };
+
+  const barDurSec = (60 / (bpm || 120)) * (tsNum || 4);
+
+  return {
+    beatId,
+    baseTempoBpm: bpm,
+    beatsPerBar: tsNum,
+    barDurSec,
+    quantizeLeadMs: 12,
+    tempoFactorDefault: 1.0,
+    sections,
+    fillMap
+  };
+}
+
+// Sprite audio : toutes les sections d'un beat dans un seul objet immuable (nom = hash du contenu)
+const SPRITE_PACK = (process.env.SPRITE_PACK || '1') !== '0';
+async function packAndUploadSprite(beatId, sections, baseUrl) {
+  const spritePath = path.join(TEMP_DIR, `${beatId}_sprite.wav`);
+  const tablePath = path.join(TEMP_DIR, `${beatId}_sprite.json`);
+  const py = path.join(SCRIPTS_DIR, 'pack_sprite.py');
+  const args = [py, TEMP_DIR, String(beatId), '--out', spritePath, '--table', tablePath,
+    '--sections', sections.map(s => s.section).join(',')];
+  if (DEBUG_SYNTH) console.log('🔧 CMD pack_sprite.py:', fmtCmd('python3', args));
+  const r = spawnSync('python3', args, { encoding: 'utf-8' });
+  if (r.status !== 0) {
+    console.warn('⚠️ pack_sprite.py a échoué :', r.stderr?.trim());
+    return null;
+  }
+  const table = JSON.parse(r.stdout.trim());
+
+  const stored = await storeArtifact(beatId, spritePath, baseUrl);
+  if (!stored) return null;
+  console.log(`📦 Sprite ${beatId} : ${table.sections.length} section(s), ${table.bytes} octets`);
+  return { ...table, url: stored.url };
+}
+
+// Ajoute au manifest la description du sprite et l'offset de chaque section
+function attachSprite(manifest, table) {
+  if (!table) return manifest;
+  const { sections: offsets, ...sprite } = table;
+  const byName = new Map(offsets.map(({ section, ...o }) => [section, o]));
+  return {
+    ...manifest,
+    sprite,
+    sections: manifest.sections.map(s => byName.has(s.section) ? { ...s, sprite: byName.get(s.section) } : s)
+  };
+}
+
+// Sections dont le rendu pleine qualité tourne encore en tâche de fond (`${beatId}_${safe}`)
+const pendingFullRenders = new Set();
+
+// 1️⃣-4️⃣ Téléchargement du .sty, extraction et normalisation de toutes les sections
+async function extractSections(beat) {
+  const beatId = beat.id;
+  const generation = manifestCache.generation(beatId); // relevée avant le téléchargement du .sty
+
+  // 1️⃣ Télécharger le .sty
+  const inputStyPath = path.join(UPLOAD_DIR, beat.filename);
+  await downloadStyFromUrl(beat.url, inputStyPath);
+
+  // 2️⃣ Extraire le MIDI complet
+  const fullMidPath = path.join(TEMP_DIR, `${beatId}_full.mid`);
+  extractMidiFromSty(inputStyPath, fullMidPath);
+
+  // 3️⃣ Extraire toutes les sections via le script Python
+  const pythonScript = path.join(__dirname, '../scripts/extract_all_sections.py');
+  const stdout = execSync(`python3 ${pythonScript} "${fullMidPath}" "${TEMP_DIR}"`, { encoding: 'utf-8' });
+  const pyJson = JSON.parse(stdout.trim());
+
+  const sectionsArray = Array.isArray(pyJson.sections) ? pyJson.sections : [];
+
+  // Métadonnées globales (on utilisera la 1re MAIN vue si besoin)
+  let globalBpm = beat.tempo || 120;
+  let globalTsNum = 4, globalTsDen = 4;
+
+  // 4️⃣ Normalisation + métadonnées
+  const prepared = [];
+  for (const section of sectionsArray) {
+    const midPath = path.join(TEMP_DIR, section.midFilename);
+
+    // 💡 Normalise tempo/TS + bank/program hors 9/10
+    normalizeSectionInplace(midPath);
+
+    // Métadonnées par section
+    const meta = readMidiMeta(midPath);
+    if (!globalBpm) globalBpm = meta.bpm;
+    if (globalTsNum === 4 && globalTsDen === 4) { globalTsNum = meta.ts_num; globalTsDen = meta.ts_den; }
+    prepared.push({ section, meta });
+  }
+
+  // Variantes d'accords rendues depuis les anciennes sections : périmées
+  forgetChordVariants(beatId);
+
+  // Sprite précédent périmé dès que les sections sont re-rendues
+  for (const ext of ['wav', 'json']) {
+    try { fs.unlinkSync(path.join(TEMP_DIR, `${beatId}_sprite.${ext}`)); } catch {}
+  }
+
+  return { prepared, bpm: globalBpm, tsNum: globalTsNum, generation };
+}
+
+// 6️⃣-7️⃣ Rendu pleine qualité + upload de toutes les sections, sprite → manifest (mis en cache)
+// ctx.lowPriority / ctx.beforeSection : pré-rendu de fond (relu à chaque section, un job promu repasse en normal)
+async function renderFullManifest(beat, extracted, opts, ctx = {}) {
+  const { wantStems, wantSprite, baseUrl, tolerant, onSectionDone } = opts;
+  const uploadResults = [];
+  for (const [i, { section, meta }] of extracted.prepared.entries()) {
+    if (ctx.beforeSection) await ctx.beforeSection();
+    try {
+      const entry = await renderAndUploadSection(beat.id, section, meta, wantStems, baseUrl, { lowPriority: !!ctx.lowPriority });
+      if (entry) uploadResults.push(entry);
+    } catch (e) {
+      if (!tolerant) throw e;
+      console.error(`❌ Rendu pleine qualité ${section.sectionName} :`, e.message);
+    } finally {
+      onSectionDone?.(i);
+    }
+  }
+
+  let manifest = buildManifest(beat.id, extracted.bpm, extracted.tsNum, uploadResults);
+
+  // 7️⃣ Sprite unique (1 requête au lieu de 2 par section)
+  if (wantSprite && uploadResults.length) {
+    try {
+      manifest = attachSprite(manifest, await packAndUploadSprite(beat.id, uploadResults, baseUrl));
+    } catch (e) {
+      if (!tolerant) throw e;
+      console.error('❌ Sprite :', e.message);
+    }
+  }
+
+  // Cache seulement un manifest complet : toutes les sections rendues et uploadées (+ sprite demandé)
+  if (uploadResults.length === extracted.prepared.length && (!wantSprite || manifest.sprite)) {
+    manifestCache.write(beat, manifest, { wantStems, wantSprite, baseUrl, gen: extracted.generation });
+  }
+
+  // Anciennes versions des artefacts re-rendus, hors réponse ; celles du manifest en cache restent
+  // (rendu tolérant incomplet : le cache n'a pas été réécrit et pointe encore dessus)
+  const written = manifestCache.manifestArtifactKeys(manifest).filter(Boolean);
+  artifacts.removeSuperseded(beat.id, written, manifestCache.referencedKeys(beat.id))
+    .then(stale => stale.length && console.log(`🧹 ${stale.length} ancienne(s) version(s) d'artefacts supprimée(s) pour beatId=${beat.id}`))
+    .catch(e => console.warn(`⚠️ Anciennes versions d'artefacts beatId=${beat.id} :`, e.message));
+  return manifest;
+}
+
+/* ──────────────────────────────────────────────────────────────
+   🔥 Pré-rendu de fond (upload / mise à jour / beats populaires)
+   - manifest pleine qualité mis en cache par beat (utils/manifestCache.js), invalidé dès que
+     le fichier, l'URL ou le tempo du beat changent, ou qu'un nouveau .sty est envoyé ; URLs
+     stockées relatives (/artifacts/…) et résolues à chaque requête avec publicBaseUrl(req)
+   - un seul prepare à la fois par beat : une ouverture rejoint le job en cours et le promeut
+   - le job de fond cède la place (entre deux sections) aux rendus interactifs et au CPU chargé
+   ────────────────────────────────────────────────────────────── */
+const PREWARM_POPULAR_TOP = parseInt(process.env.PREWARM_POPULAR_TOP || '20', 10);
+const PREWARM_BOOT_DELAY_SEC = parseFloat(process.env.PREWARM_BOOT_DELAY_SEC || '30');
+const PREWARM_RESCAN_MIN = parseFloat(process.env.PREWARM_RESCAN_MIN || '30');
+const prepareQueue = getPrepareQueue();
+const inflightPrepares = new Map(); // beatId → { promise, ctx }
+
+// Fichiers de temp/ dont dépendent /chord-variant, /render-arrangement et /sequencer-manifest
+function tempFilesReady(beatId, manifest) {
+  const names = [`${beatId}_full.mid`, ...manifest.sections.flatMap(s => [s.midFilename, s.wavFilename])];
+  if (manifest.sprite) names.push(manifest.sprite.file, `${beatId}_sprite.json`);
+  return names.every(n => n && fs.existsSync(path.join(TEMP_DIR, n)));
+}
+
+// Cache servi alors que temp/ a été nettoyé : ré-extraction des MIDI, artefacts recopiés depuis le magasin
+async function restoreTempFiles(beat, manifest) {
+  const midiMissing = [`${beat.id}_full.mid`, ...manifest.sections.map(s => s.midFilename)]
+    .some(n => !fs.existsSync(path.join(TEMP_DIR, n)));
+  if (midiMissing) await extractSections(beat);
+
+  for (const key of manifestCache.manifestArtifactKeys(manifest)) {
+    const dest = path.join(TEMP_DIR, path.basename(key).replace(/\.[0-9a-f]{16}(\.[a-z0-9]+)$/i, '$1'));
+    if (fs.existsSync(dest)) continue;
+    let hit = await artifacts.read(key);
+    if (hit?.hotPath) {
+      try {
+        await fs.promises.copyFile(hit.hotPath, dest);
+        continue;
+      } catch {
+        hit = await artifacts.read(key, { skipHot: true }); // évincé entre-temps
+      }
+    }
+    if (!hit?.buffer) throw new Error(`artefact introuvable : ${key}`);
+    await fs.promises.writeFile(dest, hit.buffer);
+  }
+
+  if (manifest.sprite) {
+    const { url, ...sprite } = manifest.sprite;
+    const sections = manifest.sections.filter(s => s.sprite).map(s => ({ section: s.section, ...s.sprite }));
+    await fs.promises.writeFile(path.join(TEMP_DIR, `${beat.id}_sprite.json`), JSON.stringify({ ...sprite, sections }));
+  }
+}
+
+function trackPrepare(beatId, ctx, fn) {
+  const promise = fn().finally(() => inflightPrepares.delete(beatId));
+  inflightPrepares.set(beatId, { promise, ctx });
+  return promise;
+}
+
+// Travail interactif en cours (prepare non-fond, ou job de fond promu par une ouverture)
+function interactiveBusy() {
+  for (const { ctx } of inflightPrepares.values()) if (!ctx.lowPriority) return true;
+  return false;
+}
+
+async function prewarmBeat(beatId) {
+  const beat = await prisma.beat.findUnique({ where: { id: beatId } });
+  if (!beat || !beat.url || inflightPrepares.has(beatId)) return;
+  // Sans requête : URLs relatives (/artifacts/…), résolues au moment de servir le manifest
+  const opts = { wantStems: process.env.RENDER_STEMS === '1', wantSprite: SPRITE_PACK, baseUrl: '', tolerant: true };
+  if (manifestCache.read(beat, opts)) return;
+
+  const ctx = { lowPriority: true };
+  ctx.beforeSection = () => prepareQueue.waitForCapacity(ctx);
+  console.log(`🔥 Pré-rendu beatId=${beatId}`);
+  await trackPrepare(beatId, ctx, async () => {
+    await ctx.beforeSection();
+    return renderFullManifest(beat, await extractSections(beat), opts, ctx);
+  });
+  console.log(`✅ Pré-rendu terminé beatId=${beatId}`);
+}
+
+// Beats les plus joués d'abord (égalité → ordre du listing /public, plus récents en tête)
+async function enqueuePopularBeats() {
+  const beats = await prisma.beat.findMany({
+    where: { url: { not: null } },
+    orderBy: [{ playCount: 'desc' }, { createdAt: 'desc' }],
+    take: PREWARM_POPULAR_TOP
+  });
+  const opts = { wantStems: process.env.RENDER_STEMS === '1', wantSprite: SPRITE_PACK };
+  let n = 0;
+  beats.forEach((beat, rank) => {
+    if (!manifestCache.read(beat, opts) && prepareQueue.enqueue(beat.id, PRIORITY.POPULAR, beats.length - rank)) n++;
+  });
+  if (n) console.log(`🔥 ${n} beat(s) populaire(s) en file de pré-rendu`);
+}
+
+prepareQueue.setRunner(prewarmBeat, interactiveBusy);
+if (prepareQueue.enabled) {
+  // Après un déploiement ou un cache vidé : les beats populaires d'abord, puis re-scan périodique
+  const scan = () => enqueuePopularBeats().catch(e => console.warn('⚠️ Scan des beats populaires :', e.message));
+  setTimeout(scan, PREWARM_BOOT_DELAY_SEC * 1000).unref();
+  if (PREWARM_RESCAN_MIN > 0) setInterval(scan, PREWARM_RESCAN_MIN * 60000).unref();
+}
+
+router.get('/prewarm-status', (req, res) => {
+  res.json(prepareQueue.stats());
+});
 
 router.post('/prepare-all-sections', async (req, res) => {
   console.log('➡️ POST /api/player/prepare-all-sections appelée');
   const { beatId } = req.body;
+  const wantStems = req.body.stems ?? (process.env.RENDER_STEMS === '1');
+  const wantPreview = req.body.preview ?? (process.env.RENDER_PREVIEW === '1');
+  const wantSprite = req.body.sprite ?? SPRITE_PACK;
+  const baseUrl = publicBaseUrl(req);
+  const useCache = req.body.cache !== false; // cache: false → rendu à froid (tests de charge)
 
   if (!beatId) {
     return res.status(400).json({ error: 'beatId est requis' });
@@ -581,104 +1033,69 @@ router.post('/prepare-all-sections', async (req, res) => {
       return res.status(404).json({ error: 'Beat ou URL introuvable' });
     }
 
-    // 1️⃣ Télécharger le .sty
-    const inputStyPath = path.join(UPLOAD_DIR, beat.filename);
-    await downloadStyFromUrl(beat.url, inputStyPath);
-
-    // 2️⃣ Extraire le MIDI complet
-    const fullMidPath = path.join(TEMP_DIR, `${beatId}_full.mid`);
-    extractMidiFromSty(inputStyPath, fullMidPath);
-
-    // 3️⃣ Extraire toutes les sections via le script Python
-    const pythonScript = path.join(__dirname, '../scripts/extract_all_sections.py');
-    const stdout = execSync(`python3 ${pythonScript} "${fullMidPath}" "${TEMP_DIR}"`, { encoding: 'utf-8' });
-    const pyJson = JSON.parse(stdout.trim());
-
-    const sectionsArray = Array.isArray(pyJson.sections) ? pyJson.sections : [];
-    const uploadResults = [];
-
-    // Métadonnées globales (on utilisera la 1re MAIN vue si besoin)
-    let globalBpm = beat.tempo || 120;
-    let globalTsNum = 4, globalTsDen = 4;
-
-    // 4️⃣ Conversion + Upload Supabase
-    for (const section of sectionsArray) {
-      const midPath = path.join(TEMP_DIR, section.midFilename);
-
-      // 💡 Normalise tempo/TS + bank/program hors 9/10
-      normalizeSectionInplace(midPath);
-
-      const wavPath = midPath.replace(/\.mid$/i, '.wav');
-
-      // Métadonnées par section
-      const meta = readMidiMeta(midPath);
-      if (!globalBpm) globalBpm = meta.bpm;
-      if (globalTsNum === 4 && globalTsDen === 4) { globalTsNum = meta.ts_num; globalTsDen = meta.ts_den; }
-
-      await convertMidToWavAsync(midPath, wavPath);
-      if (!fs.existsSync(wavPath)) continue;
-
-      // Durée quantifiée sur mesures
-      const midiDur = getMidiDurationSec(midPath);
-      const targetSec = quantizeDurationToBars(midiDur || getWavDurationSec(wavPath), meta.bpm, meta.ts_num);
-      if (targetSec && targetSec > 0) hardTrimToDuration(wavPath, targetSec);
-
-      const durationSec = getWavDurationSec(wavPath);
-
-      // Upload MIDI
-      const midBuffer = fs.readFileSync(midPath);
-      const { error: midErr } = await supabase
-        .storage
-        .from('midiAndWav')
-        .upload(`${beatId}/${section.midFilename}`, midBuffer, { cacheControl: '3600', upsert: true });
-      if (midErr) console.error(`Erreur upload MID ${section.midFilename}:`, midErr);
-
-      // Upload WAV
-      const wavBuffer = fs.readFileSync(wavPath);
-      const { error: wavErr } = await supabase
-        .storage
-        .from('midiAndWav')
-        .upload(`${beatId}/${path.basename(wavPath)}`, wavBuffer, { cacheControl: '3600', upsert: true });
-      if (wavErr) console.error(`Erreur upload WAV ${path.basename(wavPath)}:`, wavErr);
-
-      uploadResults.push({
-        section: section.sectionName,
-        loop: /^Main\s+[ABCD]$/i.test(section.sectionName),
-        oneShot: /^(Fill In\s+[ABCD]{2}|Intro\s+[ABCD]|Ending\s+[ABCD])$/i.test(section.sectionName),
-        midFilename: section.midFilename,
-        midiUrl: `${process.env.SUPABASE_URL}/storage/v1/object/public/midiAndWav/${beatId}/${section.midFilename}`,
-        wavFilename: path.basename(wavPath),
-        wavUrl: `${process.env.SUPABASE_URL}/storage/v1/object/public/midiAndWav/${beatId}/${path.basename(wavPath)}`,
-        durationSec,
-        bpm: meta.bpm,
-        beatsPerBar: meta.ts_num
-      });
+    // Popularité (ordre du pré-rendu après un déploiement)
+    prisma.beat.update({ where: { id: beat.id }, data: { playCount: { increment: 1 } } })
+      .catch(e => console.warn('⚠️ playCount non incrémenté :', e.message));
+
+    // Ouverture interactive : le job de fond en file devient inutile
+    prepareQueue.remove(beat.id);
+
+    const opts = { wantStems, wantSprite, baseUrl };
+    const cached = useCache && !inflightPrepares.has(beat.id) && manifestCache.read(beat, opts);
+    if (cached) {
+      const ready = tempFilesReady(beat.id, cached) || await trackPrepare(beat.id, { lowPriority: false },
+        () => restoreTempFiles(beat, cached))
+        .then(() => true, e => {
+          console.warn(`⚠️ Cache inutilisable pour beatId=${beat.id} (${e.message}) → nouveau rendu`);
+          manifestCache.drop(beat.id);
+          return false;
+        });
+      if (ready) {
+        console.log(`⚡ Manifest pré-rendu servi pour beatId=${beat.id}`);
+        return res.json(cached);
+      }
     }
 
-    const fillMap = {
-      'Main A': 'Fill In AA',
-      'Main B': 'Fill In BB',
-      'Main C': 'Fill In CC',
-      'Main D': 'Fill In DD'
-    };
+    // Prepare déjà en cours (pré-rendu de fond ou autre client) : on le promeut et on le rejoint
+    const running = inflightPrepares.get(beat.id);
+    if (running) {
+      running.ctx.lowPriority = false;
+      running.ctx.promoted = true;
+      await running.promise.catch(() => null);
+      const joined = manifestCache.read(beat, opts);
+      if (joined) return res.json(joined);
+      if (inflightPrepares.has(beat.id)) {
+        return res.status(409).json({ error: 'Préparation déjà en cours pour ce beat' });
+      }
+    }
 
-    const barDurSec = (60 / (globalBpm || 120)) * (globalTsNum || 4);
+    const manifest = await trackPrepare(beat.id, { lowPriority: false }, async () => {
+      const extracted = await extractSections(beat);
+
+      // 5️⃣ Aperçu rapide d'abord (optionnel) : réponse immédiate, pleine qualité ensuite
+      if (wantPreview) {
+        const previews = (await mapWithConcurrency(extracted.prepared, PREVIEW_CONCURRENCY,
+          ({ section, meta }) => renderPreviewSection(beat.id, section, meta, baseUrl))).filter(Boolean);
+        res.json({ ...buildManifest(beat.id, extracted.bpm, extracted.tsNum, previews), quality: 'preview' });
+
+        const keys = extracted.prepared.map(({ section }) => `${beat.id}_${section.sectionName.replace(/\s+/g, '_')}`);
+        keys.forEach(k => pendingFullRenders.add(k));
+        const full = await renderFullManifest(beat, extracted,
+          { ...opts, tolerant: true, onSectionDone: i => pendingFullRenders.delete(keys[i]) });
+        console.log(`✅ Rendu pleine qualité terminé pour beatId=${beat.id}`);
+        return full;
+      }
 
-    const manifest = {
-      beatId,
-      baseTempoBpm: globalBpm,
-      beatsPerBar: globalTsNum,
-      barDurSec,
-      quantizeLeadMs: 12,
-      tempoFactorDefault: 1.0,
-      sections: uploadResults,
-      fillMap
-    };
+      // 6️⃣ Conversion + Upload
+      return renderFullManifest(beat, extracted, opts);
+    });
 
-    return res.json(manifest);
+    if (!res.headersSent) return res.json(manifest);
   } catch (err) {
     console.error('❌ Erreur serveur (prepare-all-sections) :', err);
-    return res.status(500).json({ error: 'Erreur serveur interne lors de la préparation des sections' });
+    if (!res.headersSent) {
+      return res.status(500).json({ error: 'Erreur serveur interne lors de la préparation des sections' });
+    }
   }
 });
 
@@ -686,6 +1103,7 @@ router.post('/prepare-all-sections', async (req, res) => {
 router.get('/sequencer-manifest', async (req, res) => {
   const beatId = parseInt(req.query.beatId, 10);
   if (!beatId) return res.status(400).json({ error: 'beatId requis' });
+  prepareQueue.promote(beatId);
 
   try {
     const baseUrl = publicBaseUrl(req);
@@ -703,8 +1121,12 @@ router.get('/sequencer-manifest', async (req, res) => {
     for (const fam of families) {
       const safe = fam.replace(/\s+/g, '_');
       const midName = `${beatId}_${safe}.mid`;
-      const wavName = `${beatId}_${safe}.wav`;
+      let wavName = `${beatId}_${safe}.wav`;
       const midPath = path.join(TEMP_DIR, midName);
+      // Pleine qualité dès qu'elle est prête, sinon l'aperçu rapide
+      const fullReady = !pendingFullRenders.has(`${beatId}_${safe}`) && fs.existsSync(path.join(TEMP_DIR, wavName));
+      const quality = fullReady ? 'full' : 'preview';
+      if (!fullReady) wavName = `${beatId}_${safe}_preview.wav`;
       const wavPath = path.join(TEMP_DIR, wavName);
       if (fs.existsSync(midPath) && fs.existsSync(wavPath)) {
         const durationSec = getWavDurationSec(wavPath);
@@ -712,15 +1134,21 @@ router.get('/sequencer-manifest', async (req, res) => {
         const isFill = /^Fill In\s+[ABCD]{2}$/i.test(fam);
         const isIntro = /^Intro\s+[ABCD]$/i.test(fam);
         const isEnding = /^Ending\s+[ABCD]$/i.test(fam);
+        const stems = files
+          .filter(f => f.startsWith(`${beatId}_${safe}_stem_`) && f.endsWith('.wav'))
+          .map(f => ({ group: f.slice(`${beatId}_${safe}_stem_`.length, -4), wavFilename: f, wavUrl: `${baseUrl}/temp/${f}` }));
 
         sections.push({
           section: fam,
           loop: !!isMain,
           oneShot: !!(isFill || isIntro || isEnding),
+          quality,
           midFilename: midName,
           midiUrl: `${baseUrl}/temp/${midName}`,
           wavUrl: `${baseUrl}/temp/${wavName}`,
-          durationSec
+          durationSec,
+          ...(files.includes(`${beatId}_${safe}.peaks`) ? { peaksUrl: `${baseUrl}/temp/${beatId}_${safe}.peaks` } : {}),
+          ...(stems.length ? { stems } : {})
         });
       }
     }
@@ -732,16 +1160,256 @@ router.get('/sequencer-manifest', async (req, res) => {
       'Main D': 'Fill In DD'
     };
 
-    return res.json({
+    let manifest = {
       beatId,
       tempoFactorDefault: 1.0,
       sections,
       fillMap
-    });
+    };
+
+    // Sprite local seulement si toutes les sections listées sont en pleine qualité
+    const tablePath = path.join(TEMP_DIR, `${beatId}_sprite.json`);
+    if (sections.length && sections.every(s => s.quality === 'full') && fs.existsSync(tablePath)) {
+      try {
+        const table = JSON.parse(await fs.promises.readFile(tablePath, 'utf-8'));
+        manifest = attachSprite(manifest, { ...table, url: `${baseUrl}/temp/${table.file}?v=${table.sha256.slice(0, 16)}` });
+      } catch (e) {
+        console.warn('⚠️ Table de sprite illisible :', e.message);
+      }
+    }
+
+    return res.json(manifest);
   } catch (err) {
     console.error('❌ Erreur /sequencer-manifest :', err);
     return res.status(500).json({ error: 'Erreur lors de la construction du manifest' });
   }
 });
 
+/* ──────────────────────────────────────────────────────────────
+   🎚️ Arrangement complet assemblé depuis les WAV de sections
+   - aucune re-synthèse : copie PCM à offsets exacts (grille de mesures)
+   - queues de release mixées sur la section suivante
+   - WAV envoyé en flux au fur et à mesure
+   ────────────────────────────────────────────────────────────── */
+router.post('/render-arrangement', (req, res) => {
+  const { beatId, arrangement } = req.body;
+  if (!beatId || !Array.isArray(arrangement) || arrangement.length === 0) {
+    return res.status(400).json({ error: 'beatId et arrangement (liste non vide) sont requis' });
+  }
+
+  const missing = arrangement
+    .map(it => it?.section)
+    .filter(s => !s || !fs.existsSync(path.join(TEMP_DIR, `${beatId}_${String(s).replace(/\s+/g, '_')}.wav`)));
+  if (missing.length) {
+    return res.status(404).json({ error: 'Sections non préparées (lancez prepare-all-sections)', missing });
+  }
+
+  const py = path.join(SCRIPTS_DIR, 'render_arrangement.py');
+  const args = [py, TEMP_DIR, String(beatId), JSON.stringify(arrangement), '--out', '-'];
+  if (DEBUG_SYNTH) console.log('🔧 CMD render_arrangement.py:', fmtCmd('python3', args));
+
+  const p = spawn('python3', args);
+  let started = false, pyErr = '';
+  p.stderr?.on('data', d => pyErr += d.toString());
+  p.stdout.once('data', () => {
+    started = true;
+    res.setHeader('Content-Type', 'audio/wav');
+    res.setHeader('Content-Disposition', `attachment; filename="${beatId}_arrangement.wav"`);
+  });
+  p.stdout.pipe(res, { end: false });
+
+  // 'error' (spawn impossible) est suivi de 'close' : une seule réponse
+  let settled = false;
+  const finish = failed => {
+    if (settled) return;
+    settled = true;
+    if (failed && !started && !res.headersSent) {
+      return res.status(500).json({ error: 'Erreur lors de l’assemblage de l’arrangement' });
+    }
+    res.end();
+  };
+  p.on('error', err => {
+    console.error('❌ Erreur spawn render_arrangement.py :', err);
+    finish(true);
+  });
+  p.on('close', code => {
+    if (pyErr.trim()) console.log('🐍 render_arrangement.py stderr:', pyErr.trim());
+    finish(code !== 0);
+  });
+  req.on('close', () => { if (p.exitCode === null) p.kill(); });
+});
+
+/* ──────────────────────────────────────────────────────────────
+   🎼 Variantes d'accords (CASM) : rendu paresseux + cache
+   - casm.py transpose la section extraite selon NTR/NTT par canal
+   - 1 rendu par (section, root, chord), ensuite simple lookup
+   - prefetch en tâche de fond des accords les plus courants
+   ────────────────────────────────────────────────────────────── */
+const CASM_PY = path.join(SCRIPTS_DIR, 'casm.py');
+const PREFETCH_CHORDS = (process.env.PREFETCH_CHORDS || 'C:Maj,F:Maj,G:Maj,A:min,D:min,E:min,G:7,C:7,D:Maj,A:Maj')
+  .split(',').map(s => s.trim()).filter(Boolean);
+
+const chordVariantCache = new Map(); // `${beatId}|${section}|${mtime section}|${root}:${chord}` -> Promise<{ wavPath, midPath }>
+let prefetchChain = Promise.resolve();
+
+// Miroir de casm.py (NOTE_NAMES / FLAT_ALIASES / CHORD_TYPES / CHORD_INDEX) : "g" = "G", "dom7" = "7"
+const NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B'];
+const FLAT_ALIASES = { Db: 1, Eb: 3, Gb: 6, Ab: 8, Bb: 10, Cb: 11, Fb: 4, 'E#': 5, 'B#': 0 };
+const CHORD_NAMES = [
+  'Maj', 'Maj6', 'Maj7', 'Maj7#11', 'Maj9', 'Maj7_9', 'Maj6_9', 'aug',
+  'min', 'min6', 'min7', 'min7b5', 'min9', 'min7_9', 'min7_11', 'minMaj7', 'minMaj7_9',
+  'dim', 'dim7', '7', '7sus4', '7b5', '7_9', '7#11', '7_13', '7b9', '7b13', '7#9',
+  'Maj7aug', '7aug', '1+8', '1+5', 'sus4', '1+2+5'
+];
+const CHORD_ALIASES = Object.assign(
+  Object.fromEntries(CHORD_NAMES.map(n => [n.toLowerCase(), n])),
+  { '': 'Maj', m: 'min', m7: 'min7', maj: 'Maj', min: 'min', dom7: '7' }
+);
+
+/** (root, chord) canoniques tels que casm.py les résout ; null si inconnus. */
+function normalizeChord(root, chord = 'Maj') {
+  const r = String(root).trim();
+  let idx = null;
+  if (/^-?\d+$/.test(r)) idx = ((parseInt(r, 10) % 12) + 12) % 12;
+  else if (r in FLAT_ALIASES) idx = FLAT_ALIASES[r];
+  else if (NOTE_NAMES.includes(r.charAt(0).toUpperCase() + r.slice(1))) idx = NOTE_NAMES.indexOf(r.charAt(0).toUpperCase() + r.slice(1));
+  if (idx === null) return null;
+
+  const c = String(chord).trim();
+  let name = CHORD_ALIASES[c.toLowerCase()];
+  if (!name && /^\d+$/.test(c) && parseInt(c, 10) < CHORD_NAMES.length) name = CHORD_NAMES[parseInt(c, 10)];
+  return name ? { root: NOTE_NAMES[idx], chord: name } : null;
+}
+
+/** Oublie les variantes d'accords d'un beat (mémoire + fichiers) : sections ré-extraites ou nettoyées. */
+function forgetChordVariants(beatId) {
+  for (const key of chordVariantCache.keys()) {
+    if (key.startsWith(`${beatId}|`)) chordVariantCache.delete(key);
+  }
+  for (const f of fs.readdirSync(TEMP_DIR)) {
+    if (f.startsWith(`${beatId}_`) && f.includes('__')) {
+      try { fs.unlinkSync(path.join(TEMP_DIR, f)); } catch {}
+    }
+  }
+}
+
+function runPythonJson(args) {
+  return new Promise((resolve, reject) => {
+    const p = spawn('python3', args);
+    let out = '', err = '';
+    p.stdout?.on('data', d => out += d.toString());
+    p.stderr?.on('data', d => err += d.toString());
+    p.on('error', reject);
+    p.on('close', code => {
+      if (DEBUG_SYNTH && err.trim()) console.log(`🐍 ${path.basename(args[0])} stderr:`, err.trim());
+      let j = null;
+      try { j = JSON.parse(out.trim()); } catch {}
+      if (code !== 0 || !j || j.error) {
+        return reject(new Error(`${path.basename(args[0])} a échoué (code ${code}) ${j?.trace || err.trim()}`));
+      }
+      resolve(j);
+    });
+  });
+}
+
+function chordSourcePaths(beatId, sectionName) {
+  const safe = sectionName.replace(/\s+/g, '_');
+  return {
+    fullMidPath: path.join(TEMP_DIR, `${beatId}_full.mid`),
+    sectionMidPath: path.join(TEMP_DIR, `${beatId}_${safe}.mid`),
+    outPrefix: path.join(TEMP_DIR, `${beatId}_${safe}`)
+  };
+}
+
+async function renderChordVariant(beatId, sectionName, root, chord) {
+  const { fullMidPath, sectionMidPath, outPrefix } = chordSourcePaths(beatId, sectionName);
+  const j = await runPythonJson([CASM_PY, fullMidPath, sectionMidPath, outPrefix, '--section', sectionName, '--variant', `${root}:${chord}`]);
+  const v = j.variants[0];
+  const midPath = path.join(TEMP_DIR, v.midFilename);
+  const wavPath = midPath.replace(/\.mid$/i, '.wav');
+
+  // WAV déjà rendu réutilisable seulement s'il est plus récent que la section source
+  const fresh = fs.existsSync(wavPath) && fs.statSync(wavPath).mtimeMs >= fs.statSync(sectionMidPath).mtimeMs;
+  if (!fresh) {
+    await convertMidToWavAsync(midPath, wavPath);
+    const meta = readMidiMeta(midPath);
+    const targetSec = quantizeDurationToBars(getMidiDurationSec(midPath) || getWavDurationSec(wavPath), meta.bpm, meta.ts_num);
+    if (targetSec && targetSec > 0) hardTrimToDuration(wavPath, targetSec);
+  }
+  return { midPath, wavPath, root: v.root, chord: v.chord, casm: j.casm };
+}
+
+function chordVariantKey(beatId, sectionName, root, chord) {
+  const { sectionMidPath } = chordSourcePaths(beatId, sectionName);
+  const stamp = fs.existsSync(sectionMidPath) ? Math.floor(fs.statSync(sectionMidPath).mtimeMs) : 0;
+  return `${beatId}|${sectionName}|${stamp}|${root}:${chord}`;
+}
+
+/** root / chord déjà normalisés (normalizeChord). */
+function ensureChordVariant(beatId, sectionName, root, chord) {
+  const key = chordVariantKey(beatId, sectionName, root, chord);
+  let job = chordVariantCache.get(key);
+  if (!job) {
+    job = renderChordVariant(beatId, sectionName, root, chord);
+    chordVariantCache.set(key, job);
+    job.catch(() => chordVariantCache.delete(key)); // pas de cache des échecs
+  }
+  return job;
+}
+
+router.post('/chord-variant', async (req, res) => {
+  const { beatId, section, root, chord } = req.body;
+  if (!beatId || !section || root === undefined) {
+    return res.status(400).json({ error: 'beatId, section et root sont requis' });
+  }
+
+  const { fullMidPath, sectionMidPath } = chordSourcePaths(beatId, section);
+  if (!fs.existsSync(fullMidPath) || !fs.existsSync(sectionMidPath)) {
+    return res.status(404).json({ error: 'Section introuvable. Lancez d’abord prepare-all-sections.' });
+  }
+
+  const rc = normalizeChord(root, chord || 'Maj');
+  if (!rc) return res.status(400).json({ error: `Accord inconnu : ${root}:${chord || 'Maj'}` });
+
+  try {
+    const cached = chordVariantCache.has(chordVariantKey(beatId, section, rc.root, rc.chord));
+    const v = await ensureChordVariant(beatId, section, rc.root, rc.chord);
+    return res.json({
+      section,
+      root: v.root,
+      chord: v.chord,
+      casm: v.casm,
+      cached,
+      wavUrl: `${publicBaseUrl(req)}/temp/${path.basename(v.wavPath)}`
+    });
+  } catch (err) {
+    console.error('❌ Erreur /chord-variant :', err);
+    return res.status(500).json({ error: 'Erreur lors du rendu de la variante d’accord' });
+  }
+});
+
+router.post('/prefetch-chords', (req, res) => {
+  const { beatId } = req.body;
+  if (!beatId) return res.status(400).json({ error: 'beatId est requis' });
+
+  const chords = Array.isArray(req.body.chords) && req.body.chords.length ? req.body.chords : PREFETCH_CHORDS;
+  const sections = (Array.isArray(req.body.sections) ? req.body.sections : ['Main A', 'Main B', 'Main C', 'Main D'])
+    .filter(s => fs.existsSync(chordSourcePaths(beatId, s).sectionMidPath));
+
+  // Rendus en série derrière les requêtes interactives (qui ne passent pas par la chaîne)
+  for (const section of sections) {
+    for (const rc of chords) {
+      const [root, chord] = String(rc).split(':');
+      const norm = normalizeChord(root, chord || 'Maj');
+      if (!norm) continue;
+      prefetchChain = prefetchChain
+        .then(() => ensureChordVariant(beatId, section, norm.root, norm.chord))
+        .catch(err => console.warn(`⚠️ Prefetch ${section} ${rc} :`, err.message));
+    }
+  }
+
+  console.log(`🎼 Prefetch accords beatId=${beatId} : ${sections.length} section(s) × ${chords.length} accord(s)`);
+  return res.status(202).json({ beatId, sections, chords, queued: sections.length * chords.length });
+});
+
 module.exports = router;
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# scripts/casm.py
+"""
+Interprète CASM (Channel Assignment) d'un style Yamaha + transposition d'accords.
+
+Le pattern source d'un style est enregistré dans un accord de référence
+(généralement CMaj7). Le chunk CASM, placé après les pistes MIDI dans le .sty,
+indique pour chaque partie (canal) comment suivre l'accord joué :
+NTR (Note Transposition Rule) et NTT (Note Transposition Table), limites de
+notes, high key, mutes par note/accord, canal de destination.
+
+Usage :
+  python3 casm.py full.mid section.mid out_prefix --section "Main A" \
+      --variant C:Maj --variant A:min7 ...
+
+- full.mid    : MIDI brut extrait du .sty (contient aussi le CASM en queue)
+- section.mid : section extraite par extract_all_sections.py
+- out_prefix  : chaque variante est écrite dans <out_prefix>__<Root>_<Chord>.mid
+
+Sortie JSON (stdout) : {"casm": bool, "variants": [{root, chord, midFilename}]}
+"""
+import argparse, json, os, struct, sys, traceback
+from mido import MidiFile, MidiTrack
+
+def log_info(*a):  print("ℹ️", *a, file=sys.stderr, flush=True)
+def log_warn(*a):  print("⚠️", *a, file=sys.stderr, flush=True)
+
+# ---------------- Accords ----------------
+NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+FLAT_ALIASES = {"Db": 1, "Eb": 3, "Gb": 6, "Ab": 8, "Bb": 10, "Cb": 11, "Fb": 4, "E#": 5, "B#": 0}
+
+# Types d'accords Yamaha (numérotation XG / CASM) → (nom court, intervalles)
+CHORD_TYPES = [
+    ("Maj",      (0, 4, 7)),
+    ("Maj6",     (0, 4, 7, 9)),
+    ("Maj7",     (0, 4, 7, 11)),
+    ("Maj7#11",  (0, 4, 6, 7, 11)),
+    ("Maj9",     (0, 2, 4, 7)),
+    ("Maj7_9",   (0, 2, 4, 7, 11)),
+    ("Maj6_9",   (0, 2, 4, 7, 9)),
+    ("aug",      (0, 4, 8)),
+    ("min",      (0, 3, 7)),
+    ("min6",     (0, 3, 7, 9)),
+    ("min7",     (0, 3, 7, 10)),
+    ("min7b5",   (0, 3, 6, 10)),
+    ("min9",     (0, 2, 3, 7)),
+    ("min7_9",   (0, 2, 3, 7, 10)),
+    ("min7_11",  (0, 3, 5, 7, 10)),
+    ("minMaj7",  (0, 3, 7, 11)),
+    ("minMaj7_9", (0, 2, 3, 7, 11)),
+    ("dim",      (0, 3, 6)),
+    ("dim7",     (0, 3, 6, 9)),
+    ("7",        (0, 4, 7, 10)),
+    ("7sus4",    (0, 5, 7, 10)),
+    ("7b5",      (0, 4, 6, 10)),
+    ("7_9",      (0, 2, 4, 7, 10)),
+    ("7#11",     (0, 4, 6, 7, 10)),
+    ("7_13",     (0, 4, 7, 9, 10)),
+    ("7b9",      (0, 1, 4, 7, 10)),
+    ("7b13",     (0, 4, 7, 8, 10)),
+    ("7#9",      (0, 3, 4, 7, 10)),
+    ("Maj7aug",  (0, 4, 8, 11)),
+    ("7aug",     (0, 4, 8, 10)),
+    ("1+8",      (0,)),
+    ("1+5",      (0, 7)),
+    ("sus4",     (0, 5, 7)),
+    ("1+2+5",    (0, 2, 7)),
+]
+CHORD_INDEX = {name.lower(): i for i, (name, _) in enumerate(CHORD_TYPES)}
+CHORD_INDEX.update({"": 0, "m": 8, "m7": 10, "maj": 0, "min": 8, "dom7": 19})
+
+def parse_root(s):
+    s = str(s).strip()
+    if s.lstrip("-").isdigit():
+        return int(s) % 12
+    if s in FLAT_ALIASES:
+        return FLAT_ALIASES[s]
+    up = s[:1].upper() + s[1:]
+    if up in NOTE_NAMES:
+        return NOTE_NAMES.index(up)
+    raise ValueError(f"Fondamentale inconnue : {s}")
+
+def parse_chord(s):
+    s = str(s).strip()
+    key = s.lower()
+    if key in CHORD_INDEX:
+        return CHORD_INDEX[key]
+    if s.isdigit() and int(s) < len(CHORD_TYPES):
+        return int(s)
+    raise ValueError(f"Type d'accord inconnu : {s}")
+
+def variant_key(root, chord):
+    """Nom de fichier stable pour (root, chord) : ex. 'Cs_min7' pour C#min7."""
+    return f"{NOTE_NAMES[root].replace('#', 's')}_{CHORD_TYPES[chord][0].replace('#', 's').replace('+', 'p')}"
+
+# ---------------- CASM ----------------
+NTR_ROOT_TRANS, NTR_ROOT_FIXED, NTR_GUITAR = 0, 1, 2
+NTT_BYPASS, NTT_MELODY, NTT_CHORD, NTT_BASS = 0, 1, 2, 3
+
+def default_parts():
+    """Règles par défaut (style sans CASM) : source CMaj7, canaux 8..15."""
+    parts = {}
+    for ch in range(8, 16):
+        if ch in (8, 9):
+            ntr, ntt = NTR_ROOT_FIXED, NTT_BYPASS
+        elif ch == 10:
+            ntr, ntt = NTR_ROOT_FIXED, NTT_BASS
+        else:
+            ntr, ntt = NTR_ROOT_TRANS, NTT_CHORD
+        parts[ch] = {
+            "src": ch, "dest": ch, "name": "",
+            "note_mask": 0xFFF, "chord_mask": (1 << len(CHORD_TYPES)) - 1,
+            "src_root": 0, "src_chord": 2,
+            "ntr": ntr, "ntt": ntt, "high_key": 11, "low": 0, "high": 127,
+        }
+    return parts
+
+def _decode_ntt(raw, sff2):
+    """NTT CASM → NTT interne. Bit 7 = 'bass on' ; les tables mineures SFF2 suivent la mélodie."""
+    if raw & 0x80:
+        return NTT_BASS
+    v = raw & 0x7F
+    if v == 0:
+        return NTT_BYPASS
+    if v == 2:
+        return NTT_CHORD
+    if v == 3 and not sff2:
+        return NTT_BASS
+    return NTT_MELODY
+
+def _parse_ctab(data, sff2):
+    if len(data) < 26:
+        return None
+    note_mask = ((data[11] & 0x0F) << 8) | data[12]
+    chord_mask = int.from_bytes(data[13:18], "big")
+    part = {
+        "src": data[0] & 0x0F,
+        "name": data[1:9].decode("latin-1", errors="ignore").strip(),
+        "dest": data[9] & 0x0F,
+        "note_mask": note_mask or 0xFFF,
+        "chord_mask": chord_mask or (1 << len(CHORD_TYPES)) - 1,
+        "src_root": data[18] % 12,
+        "src_chord": data[19] if data[19] < len(CHORD_TYPES) else 2,
+    }
+    # Ctab : règles en 20..25 ; Ctb2 : 3 plages (basse/moyenne/haute), on garde la moyenne
+    off = 28 if sff2 and len(data) >= 34 else 20
+    part.update({
+        "ntr": data[off] if data[off] in (0, 1, 2) else NTR_ROOT_TRANS,
+        "ntt": _decode_ntt(data[off + 1], sff2),
+        "high_key": data[off + 2] % 12,
+        "low": min(data[off + 3], 127),
+        "high": min(data[off + 4], 127),
+    })
+    return part
+
+def _chunks(buf, pos, end):
+    while pos + 8 <= end:
+        cid = buf[pos:pos + 4]
+        (size,) = struct.unpack(">I", buf[pos + 4:pos + 8])
+        yield cid, pos + 8, min(pos + 8 + size, end)
+        pos += 8 + size
+
+def midi_end_offset(buf):
+    """Offset juste après le dernier chunk MTrk (le CASM suit les pistes)."""
+    pos = buf.find(b"MThd")
+    if pos < 0:
+        return 0
+    for cid, start, end in _chunks(buf, pos, len(buf)):
+        if cid not in (b"MThd", b"MTrk"):
+            return start - 8
+        pos = end
+    return pos
+
+def parse_casm(buf):
+    """Liste de CSEG : [{"sections": [...], "parts": {src_ch: part}}]. Vide si pas de CASM."""
+    at = buf.find(b"CASM", midi_end_offset(buf))
+    if at < 0:
+        return []
+    (size,) = struct.unpack(">I", buf[at + 4:at + 8])
+    segs = []
+    for cid, start, end in _chunks(buf, at + 8, min(at + 8 + size, len(buf))):
+        if cid != b"CSEG":
+            continue
+        seg = {"sections": [], "parts": {}}
+        for sub, s0, s1 in _chunks(buf, start, end):
+            if sub == b"Sdec":
+                names = buf[s0:s1].decode("latin-1", errors="ignore")
+                seg["sections"] = [n.strip() for n in names.split(",") if n.strip()]
+            elif sub in (b"Ctab", b"Ctb2"):
+                part = _parse_ctab(buf[s0:s1], sff2=(sub == b"Ctb2"))
+                if part:
+                    seg["parts"][part["src"]] = part
+        segs.append(seg)
+    return segs
+
+def parts_for_section(segs, section):
+    for seg in segs:
+        if section in seg["sections"]:
+            return seg["parts"]
+    return None
+
+# ---------------- Transposition ----------------
+def _nearest_tone(rel, tones):
+    """Ton de l'accord le plus proche de rel (distance circulaire, égalité → vers le bas)."""
+    best, best_d = rel, 99
+    for t in tones:
+        d = (t - rel + 6) % 12 - 6  # -6..5
+        if abs(d) < best_d or (abs(d) == best_d and d < 0):
+            best, best_d = rel + d, abs(d)
+    return best
+
+def map_note(note, part, dst_root, dst_chord):
+    src_root = part["src_root"]
+    src_tones = CHORD_TYPES[part["src_chord"]][1]
+    dst_tones = CHORD_TYPES[dst_chord][1]
+    ntt = part["ntt"]
+    if ntt == NTT_BYPASS and part["ntr"] != NTR_ROOT_TRANS:
+        return note  # batterie / parties fixes : jamais transposées
+
+    rel = (note - src_root) % 12
+    base = note - rel
+    if ntt == NTT_BYPASS:
+        new_rel = rel
+    elif ntt == NTT_BASS and rel == 0:
+        new_rel = 0
+    elif ntt in (NTT_CHORD, NTT_BASS) or rel in src_tones:
+        # ton d'accord → ton le plus proche dans l'accord cible
+        new_rel = _nearest_tone(rel, dst_tones)
+    else:
+        # note de passage (mélodie) : suit le décalage du ton d'accord inférieur
+        below = max((t for t in src_tones if t <= rel), default=0)
+        mapped = _nearest_tone(below, dst_tones)
+        new_rel = rel + (mapped - below)
+
+    delta = (dst_root - src_root) % 12
+    if part["ntr"] == NTR_ROOT_TRANS:
+        shift = delta - 12 if dst_root > part["high_key"] else delta
+    else:  # root fixed / guitar : le plus près possible de la note d'origine
+        shift = (delta + 6) % 12 - 6
+
+    n = base + new_rel + shift
+    low, high = part["low"], part["high"]
+    if high - low >= 11:
+        while n < low:
+            n += 12
+        while n > high:
+            n -= 12
+    return max(0, min(127, n))
+
+def part_enabled(part, dst_root, dst_chord):
+    """Note mute / chord mute : bit n à 1 = la partie joue pour la note / le type d'accord n."""
+    return bool(part["note_mask"] >> dst_root & 1) and bool(part["chord_mask"] >> dst_chord & 1)
+
+def transpose_midi(mf, parts, dst_root, dst_chord):
+    """Copie de mf transposée pour (dst_root, dst_chord) selon les règles CASM par canal."""
+    out = MidiFile(ticks_per_beat=mf.ticks_per_beat)
+    enabled = {ch: part_enabled(p, dst_root, dst_chord) for ch, p in parts.items()}
+    for tr in mf.tracks:
+        nt = MidiTrack()
+        active = {}     # (dest_ch, note) -> nb de note_on superposées
+        carry = 0       # delta des messages supprimés, reporté sur le suivant
+        for msg in tr:
+            if msg.is_meta or not hasattr(msg, "channel") or msg.channel not in parts:
+                nt.append(msg.copy(time=msg.time + carry)); carry = 0
+                continue
+            part = parts[msg.channel]
+            m = msg.copy(time=msg.time + carry, channel=part["dest"]); carry = 0
+            if m.type in ("note_on", "note_off"):
+                if not enabled[msg.channel]:
+                    carry = m.time
+                    continue
+                m.note = map_note(msg.note, part, dst_root, dst_chord)
+                key = (m.channel, m.note)
+                if m.type == "note_on" and m.velocity > 0:
+                    active[key] = active.get(key, 0) + 1
+                    if active[key] > 1:   # deux notes source → même note cible
+                        carry = m.time
+                        continue
+                else:
+                    if active.get(key, 0) > 1:
+                        active[key] -= 1
+                        carry = m.time
+                        continue
+                    active.pop(key, None)
+            nt.append(m)
+        out.tracks.append(nt)
+    return out
+
+# ---------------- CLI ----------------
+def main():
+    ap = argparse.ArgumentParser(description="Transposition CASM d'une section de style.")
+    ap.add_argument("full_mid")
+    ap.add_argument("section_mid")
+    ap.add_argument("out_prefix")
+    ap.add_argument("--section", required=True)
+    ap.add_argument("--variant", action="append", default=[], help="Root:Chord, ex. G:7 ou A:min")
+    args = ap.parse_args()
+
+    try:
+        with open(args.full_mid, "rb") as f:
+            buf = f.read()
+        segs = parse_casm(buf)
+        parts = parts_for_section(segs, args.section)
+        if not parts:   # pas de CASM, ou CSEG sans Ctab
+            log_warn("Pas de règles CASM pour", args.section, "→ règles par défaut (source CMaj7)")
+            parts = default_parts()
+        else:
+            log_info("CASM", args.section, ":", {ch: (p["name"], p["ntr"], p["ntt"]) for ch, p in parts.items()})
+
+        mf = MidiFile(args.section_mid)
+        out_dir = os.path.dirname(os.path.abspath(args.out_prefix))
+        items = []
+        for v in args.variant:
+            root_s, _, chord_s = v.partition(":")
+            root, chord = parse_root(root_s), parse_chord(chord_s or "Maj")
+            out_path = os.path.join(out_dir, f"{os.path.basename(args.out_prefix)}__{variant_key(root, chord)}.mid")
+            transpose_midi(mf, parts, root, chord).save(out_path)
+            items.append({
+                "root": NOTE_NAMES[root],
+                "chord": CHORD_TYPES[chord][0],
+                "midFilename": os.path.basename(out_path),
+            })
+        print(json.dumps({"casm": bool(segs), "variants": items}, ensure_ascii=False))
+        return 0
+    except Exception:
+        print(json.dumps({"error": "exception", "trace": traceback.format_exc()}))
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# scripts/finalize_wav.py
+"""
+Étape finale d'un rendu de section : coupe exacte + pics de forme d'onde.
+
+En une seule passe sur le PCM en mémoire :
+  1. tronque / complète le WAV à la durée exacte (nombre entier de mesures) ;
+  2. réécrit le WAV final ;
+  3. calcule des pics min/max multi-résolution (numpy, réduction vectorisée)
+     et les écrit dans un sidecar binaire compact (.peaks, quelques Ko).
+
+Format .peaks (little-endian) :
+  b"PKS1" | u32 sample_rate | u32 frames | u16 levels
+  puis pour chaque niveau : u32 samples_per_pixel | u32 pixels | int8[pixels*2] (min,max)...
+  Valeurs = int16 >> 8 (mono : min/max sur tous les canaux).
+
+Usage :
+  python3 finalize_wav.py section.wav --seconds 7.5 [--peaks section.peaks] [--spp 256,512,1024,2048]
+Sortie JSON (stdout) : {"frames", "sampleRate", "peaks", "peaksBytes"}
+"""
+import argparse, json, os, struct, sys, wave
+import numpy as np
+
+def log_err(*a):   print("❌", *a, file=sys.stderr, flush=True)
+
+DEFAULT_SPP = (256, 512, 1024, 2048)
+
+def compute_peaks(pcm, spp_levels=DEFAULT_SPP):
+    """pcm : int16 (frames, channels) → [(spp, int8 array (pixels, 2))].
+    Le premier niveau est réduit depuis le PCM, les suivants depuis le niveau
+    précédent (min/max de paires) tant que les facteurs sont entiers."""
+    lo = pcm.min(axis=1) if pcm.ndim > 1 else pcm
+    hi = pcm.max(axis=1) if pcm.ndim > 1 else pcm
+    levels, prev = [], None
+    for spp in sorted(spp_levels):
+        if prev is not None and spp % prev[0] == 0:
+            f = spp // prev[0]
+            mins, maxs = prev[1], prev[2]
+            pad = (-len(mins)) % f
+            mins = np.concatenate([mins, mins[-1:].repeat(pad)]) if pad else mins
+            maxs = np.concatenate([maxs, maxs[-1:].repeat(pad)]) if pad else maxs
+            mins, maxs = mins.reshape(-1, f).min(axis=1), maxs.reshape(-1, f).max(axis=1)
+        else:
+            pad = (-len(lo)) % spp
+            l = np.concatenate([lo, np.zeros(pad, lo.dtype)]) if pad else lo
+            h = np.concatenate([hi, np.zeros(pad, hi.dtype)]) if pad else hi
+            mins, maxs = l.reshape(-1, spp).min(axis=1), h.reshape(-1, spp).max(axis=1)
+        prev = (spp, mins, maxs)
+        q = np.stack([mins >> 8, maxs >> 8], axis=1).astype(np.int8)
+        levels.append((spp, q))
+    return levels
+
+def write_peaks(path, sample_rate, frames, levels):
+    with open(path, "wb") as f:
+        f.write(b"PKS1" + struct.pack("<IIH", sample_rate, frames, len(levels)))
+        for spp, q in levels:
+            f.write(struct.pack("<II", spp, len(q)))
+            f.write(q.tobytes())
+    return os.path.getsize(path)
+
+def finalize(wav_path, seconds=None, peaks_path=None, spp_levels=DEFAULT_SPP):
+    with wave.open(wav_path, "rb") as w:
+        params = w.getparams()
+        if params.sampwidth != 2:
+            raise ValueError("PCM 16-bit attendu")
+        pcm = np.frombuffer(w.readframes(params.nframes), dtype="<i2").reshape(-1, params.nchannels)
+    sr = params.framerate
+
+    if seconds is not None:
+        frames = int(round(float(seconds) * sr))
+        if frames < len(pcm):
+            pcm = pcm[:frames]
+        elif frames > len(pcm):
+            pcm = np.concatenate([pcm, np.zeros((frames - len(pcm), params.nchannels), pcm.dtype)])
+        tmp = wav_path + ".tmp"
+        with wave.open(tmp, "wb") as w:
+            w.setnchannels(params.nchannels)
+            w.setsampwidth(2)
+            w.setframerate(sr)
+            w.writeframes(pcm.astype("<i2").tobytes())
+        os.replace(tmp, wav_path)
+
+    out = {"frames": int(len(pcm)), "sampleRate": sr}
+    if peaks_path:
+        out["peaks"] = peaks_path
+        out["peaksBytes"] = write_peaks(peaks_path, sr, len(pcm), compute_peaks(pcm, spp_levels))
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description="Coupe exacte du WAV final + sidecar de pics.")
+    ap.add_argument("wav")
+    ap.add_argument("--seconds", type=float, default=None)
+    ap.add_argument("--peaks", default=None)
+    ap.add_argument("--spp", default=",".join(map(str, DEFAULT_SPP)))
+    args = ap.parse_args()
+    try:
+        spp = tuple(int(x) for x in args.spp.split(",") if x.strip())
+        print(json.dumps(finalize(args.wav, args.seconds, args.peaks, spp)))
+        return 0
+    except Exception as e:
+        log_err("finalize_wav :", e)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# scripts/pack_sprite.py
+"""
+Empaquette toutes les sections rendues d'un beat en un seul « sprite » audio.
+
+Un fichier WAV unique (RIFF standard, lisible tel quel par un navigateur) :
+  - chunk 'data' : les WAV de sections bout à bout, chaque début aligné sur
+    --align échantillons, séparés par au moins --gap-ms de silence
+    (aucun débordement d'une section sur la suivante au décodage / rééchantillonnage) ;
+  - chunk 'smid' (ignoré par les décodeurs audio) : les .mid de sections concaténés.
+
+Table d'offsets JSON (--table) : pour chaque section, offset/longueur en
+échantillons et en octets dans le fichier (requêtes Range possibles), plus
+offset/longueur du MIDI. Le sha256 du sprite sert de nom d'objet immuable.
+
+Usage :
+  python3 pack_sprite.py <temp_dir> <beatId> --out sprite.wav --table sprite.json
+                         [--sections "Main A,Fill In AA,..."] [--align 4096] [--gap-ms 50]
+Sortie JSON (stdout) : la table.
+"""
+import argparse, hashlib, json, os, struct, sys, wave
+
+def log_info(*a):  print("ℹ️", *a, file=sys.stderr, flush=True)
+def log_warn(*a):  print("⚠️", *a, file=sys.stderr, flush=True)
+def log_err(*a):   print("❌", *a, file=sys.stderr, flush=True)
+
+LETTERS = "ABCD"
+FAMILIES = ([f"Main {l}" for l in LETTERS] + [f"Fill In {l}{l}" for l in LETTERS]
+            + [f"Intro {l}" for l in LETTERS] + [f"Ending {l}" for l in LETTERS])
+HEADER_BYTES = 44          # RIFF + fmt (16) + en-tête data
+
+def section_stem(temp_dir, beat_id, name):
+    return os.path.join(temp_dir, f"{beat_id}_{name.replace(' ', '_')}")
+
+def pack(temp_dir, beat_id, out_path, names=None, align=4096, gap_ms=50):
+    names = names or [n for n in FAMILIES if os.path.isfile(section_stem(temp_dir, beat_id, n) + ".wav")]
+    if not names:
+        raise FileNotFoundError(f"Aucune section rendue pour beatId={beat_id}")
+
+    fmt, parts = None, []
+    for name in names:
+        stem = section_stem(temp_dir, beat_id, name)
+        with wave.open(stem + ".wav", "rb") as w:
+            p = (w.getframerate(), w.getnchannels(), w.getsampwidth())
+            if p[2] != 2:
+                raise ValueError(f"PCM 16-bit attendu : {stem}.wav")
+            if fmt is None:
+                fmt = p
+            elif p != fmt:
+                raise ValueError(f"Format incohérent pour {name} : {p} ≠ {fmt}")
+            pcm = w.readframes(w.getnframes())
+        midi = b""
+        if os.path.isfile(stem + ".mid"):
+            with open(stem + ".mid", "rb") as f:
+                midi = f.read()
+        else:
+            log_warn("MIDI absent :", stem + ".mid")
+        parts.append((name, pcm, midi))
+
+    sr, ch, _ = fmt
+    block = ch * 2
+    gap = int(sr * gap_ms / 1000)
+
+    # Placement : début de chaque section aligné sur 'align' échantillons
+    entries, frame = [], 0
+    for name, pcm, _midi in parts:
+        frames = len(pcm) // block
+        entries.append({"section": name, "offsetFrames": frame, "lengthFrames": frames})
+        frame = -(-(frame + frames + gap) // align) * align
+    total_frames = entries[-1]["offsetFrames"] + entries[-1]["lengthFrames"]
+    data_len = total_frames * block
+
+    midi_blob = b"".join(m for _n, _p, m in parts)
+    smid_len = len(midi_blob)
+    smid_pad = smid_len & 1
+    midi_base = HEADER_BYTES + data_len + (data_len & 1) + 8
+    riff_len = 4 + (8 + 16) + (8 + data_len + (data_len & 1)) + (8 + smid_len + smid_pad)
+
+    sha = hashlib.sha256()
+    tmp = out_path + ".tmp"
+    with open(tmp, "wb") as fh:
+        def put(b):
+            fh.write(b)
+            sha.update(b)
+        put(b"RIFF" + struct.pack("<I", riff_len) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, ch, sr, sr * block, block, 16)
+            + b"data" + struct.pack("<I", data_len))
+        written = 0
+        for e, (_name, pcm, _midi) in zip(entries, parts):
+            pad = e["offsetFrames"] * block - written
+            if pad:
+                put(b"\0" * pad)
+            put(pcm[:e["lengthFrames"] * block])
+            written = (e["offsetFrames"] + e["lengthFrames"]) * block
+        if data_len & 1:
+            put(b"\0")
+        put(b"smid" + struct.pack("<I", smid_len) + midi_blob + (b"\0" if smid_pad else b""))
+    os.replace(tmp, out_path)
+
+    midi_off = midi_base
+    for e, (_name, _pcm, midi) in zip(entries, parts):
+        e["offsetSec"] = round(e["offsetFrames"] / sr, 6)
+        e["durationSec"] = round(e["lengthFrames"] / sr, 6)
+        e["byteOffset"] = HEADER_BYTES + e["offsetFrames"] * block
+        e["byteLength"] = e["lengthFrames"] * block
+        e["midiOffset"] = midi_off
+        e["midiLength"] = len(midi)
+        midi_off += len(midi)
+
+    table = {
+        "version": 1,
+        "file": os.path.basename(out_path),
+        "sha256": sha.hexdigest(),
+        "bytes": os.path.getsize(out_path),
+        "sampleRate": sr,
+        "channels": ch,
+        "frames": total_frames,
+        "alignFrames": align,
+        "sections": entries,
+    }
+    log_info(f"Sprite {len(entries)} section(s), {total_frames / sr:.2f}s, {table['bytes']} octets")
+    return table
+
+def read_section_midi(sprite_path, entry):
+    """Octets MIDI d'une section, lus par offset dans le sprite."""
+    with open(sprite_path, "rb") as f:
+        f.seek(entry["midiOffset"])
+        return f.read(entry["midiLength"])
+
+def main():
+    ap = argparse.ArgumentParser(description="Sprite audio unique + table d'offsets pour un beat.")
+    ap.add_argument("temp_dir")
+    ap.add_argument("beat_id")
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--table", default=None)
+    ap.add_argument("--sections", default=None, help="noms séparés par des virgules (défaut : toutes, ordre canonique)")
+    ap.add_argument("--align", type=int, default=4096)
+    ap.add_argument("--gap-ms", type=float, default=50)
+    args = ap.parse_args()
+    try:
+        names = [s.strip() for s in args.sections.split(",") if s.strip()] if args.sections else None
+        table = pack(args.temp_dir, args.beat_id, args.out, names, max(1, args.align), max(0.0, args.gap_ms))
+        if args.table:
+            with open(args.table, "w", encoding="utf-8") as f:
+                json.dump(table, f, ensure_ascii=False)
+        print(json.dumps(table, ensure_ascii=False))
+        return 0
+    except Exception as e:
+        log_err("pack_sprite :", e)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
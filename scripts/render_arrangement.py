@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# scripts/render_arrangement.py
+"""
+Assemble un morceau complet à partir des WAV de sections déjà rendus
+(prepare-all-sections), sans re-synthèse TiMidity.
+
+Arrangement (JSON) : [{"section": "Intro A"}, {"section": "Main A", "repeat": 8},
+                      {"section": "Fill In AB"}, {"section": "Main B", "repeat": 8},
+                      {"section": "Ending B"}]
+
+- Chaque occurrence est posée à un offset exact en échantillons, calculé sur la
+  grille de mesures (pas de dérive d'arrondi cumulée).
+- La queue de release/réverb de chaque occurrence (<section>_tail.wav, coupée
+  par le trim sur mesures) est mixée par-dessus le début de la suivante.
+- Sortie WAV PCM 16-bit écrite en flux, bloc par bloc (corps = simple copie,
+  addition seulement là où une queue déborde).
+- "repeat" borné à MAX_REPEAT ; une sortie au-delà de la limite 4 Go d'un WAV est refusée.
+
+Usage :
+  python3 render_arrangement.py <temp_dir> <beatId> '<arrangement JSON>' [--out file.wav|-]
+"""
+import argparse, json, os, struct, sys, wave
+import numpy as np
+from mido import MidiFile, tempo2bpm
+
+MAX_REPEAT = int(os.environ.get("ARRANGEMENT_MAX_REPEAT", "64"))
+WAV_MAX_DATA = 0xFFFFFFFF - 36   # champs de taille RIFF / data sur 32 bits
+
+def log_info(*a):  print("ℹ️", *a, file=sys.stderr, flush=True)
+def log_warn(*a):  print("⚠️", *a, file=sys.stderr, flush=True)
+def log_err(*a):   print("❌", *a, file=sys.stderr, flush=True)
+
+def read_wav(path):
+    with wave.open(path, "rb") as w:
+        if w.getsampwidth() != 2:
+            raise ValueError(f"PCM 16-bit attendu : {path}")
+        ch, sr = w.getnchannels(), w.getframerate()
+        pcm = np.frombuffer(w.readframes(w.getnframes()), dtype="<i2").reshape(-1, ch)
+    return pcm, sr
+
+def bar_seconds(mid_path):
+    bpm, num = 120.0, 4
+    mf = MidiFile(mid_path)
+    metas = [m for tr in mf.tracks for m in tr if m.is_meta]
+    tempo = next((m for m in metas if m.type == "set_tempo"), None)
+    ts = next((m for m in metas if m.type == "time_signature"), None)
+    if tempo:
+        bpm = float(tempo2bpm(tempo.tempo))
+    if ts:
+        num = ts.numerator
+    return 60.0 / bpm * num
+
+def wav_header(frames, sr, ch):
+    data_len = frames * ch * 2
+    return (b"RIFF" + struct.pack("<I", 36 + data_len) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, ch, sr, sr * ch * 2, ch * 2, 16)
+            + b"data" + struct.pack("<I", data_len))
+
+class SectionAudio:
+    __slots__ = ("name", "body", "tail", "bars")
+
+def load_sections(temp_dir, beat_id, names):
+    cache, fmt, bar_sec = {}, None, None
+    for name in names:
+        if name in cache:
+            continue
+        stem = os.path.join(temp_dir, f"{beat_id}_{name.replace(' ', '_')}")
+        if not os.path.isfile(stem + ".wav"):
+            raise FileNotFoundError(f"WAV de section introuvable : {stem}.wav")
+        s = SectionAudio()
+        s.name = name
+        s.body, sr = read_wav(stem + ".wav")
+        s.tail = None
+        if os.path.isfile(stem + "_tail.wav"):
+            tail, tail_sr = read_wav(stem + "_tail.wav")
+            # Queue d'un autre format (rendu antérieur, RENDER_SR modifié) : ignorée plutôt que mixée à la mauvaise vitesse
+            if (tail_sr, tail.shape[1]) == (sr, s.body.shape[1]):
+                s.tail = tail
+            else:
+                log_warn(f"Queue ignorée pour {name} : {(tail_sr, tail.shape[1])} ≠ {(sr, s.body.shape[1])}")
+        if fmt is None:
+            fmt = (sr, s.body.shape[1])
+            bar_sec = bar_seconds(stem + ".mid") if os.path.isfile(stem + ".mid") else 2.0
+        elif (sr, s.body.shape[1]) != fmt:
+            raise ValueError(f"Format incohérent pour {name} : {(sr, s.body.shape[1])} ≠ {fmt}")
+        s.bars = max(1, round(len(s.body) / (bar_sec * sr)))
+        cache[name] = s
+    return cache, fmt, bar_sec
+
+def plan(arrangement, sections, sr, bar_sec):
+    """[(section, start_sample, length)] alignés sur la grille de mesures."""
+    out, bars = [], 0
+    for item in arrangement:
+        s = sections[item["section"]]
+        for _ in range(min(MAX_REPEAT, max(1, int(item.get("repeat", 1))))):
+            start = round(bars * bar_sec * sr)
+            bars += s.bars
+            out.append((s, start, round(bars * bar_sec * sr) - start))
+    return out
+
+def render(arrangement, temp_dir, beat_id, fh, with_tails=True):
+    names = [it["section"] for it in arrangement]
+    sections, (sr, ch), bar_sec = load_sections(temp_dir, beat_id, names)
+    placements = plan(arrangement, sections, sr, bar_sec)
+
+    last_s, last_start, last_len = placements[-1]
+    last_tail = len(last_s.tail) if with_tails and last_s.tail is not None else 0
+    total = last_start + last_len + last_tail
+    if total * ch * 2 > WAV_MAX_DATA:
+        raise ValueError(f"arrangement trop long pour un WAV : {total / sr:.0f}s")
+    fh.write(wav_header(total, sr, ch))
+    log_info(f"{len(placements)} occurrence(s), {total / sr:.2f}s, mesure {bar_sec:.3f}s, {sr} Hz × {ch}")
+
+    carry = np.zeros((0, ch), dtype=np.int32)   # queues qui débordent sur la suite
+    for s, _start, length in placements:
+        block = np.zeros((length, ch), dtype=np.int16)
+        n = min(length, len(s.body))
+        block[:n] = s.body[:n]
+        if len(carry):
+            k = min(length, len(carry))
+            mixed = block[:k].astype(np.int32) + carry[:k]
+            block[:k] = np.clip(mixed, -32768, 32767)
+            carry = carry[k:]
+        if with_tails and s.tail is not None:
+            tail = s.tail.astype(np.int32)
+            if len(carry) < len(tail):
+                carry = np.concatenate([carry, np.zeros((len(tail) - len(carry), ch), dtype=np.int32)])
+            carry[:len(tail)] += tail
+        fh.write(block.astype("<i2").tobytes())
+    rest = np.clip(carry[:last_tail], -32768, 32767).astype("<i2")
+    fh.write(rest.tobytes())
+    fh.flush()
+    return total
+
+def main():
+    ap = argparse.ArgumentParser(description="Assemblage d'un arrangement depuis les WAV de sections.")
+    ap.add_argument("temp_dir")
+    ap.add_argument("beat_id")
+    ap.add_argument("arrangement", help="JSON (liste) ou chemin d'un fichier JSON")
+    ap.add_argument("--out", default="-")
+    ap.add_argument("--no-tails", action="store_true")
+    args = ap.parse_args()
+
+    try:
+        if os.path.isfile(args.arrangement):
+            with open(args.arrangement, encoding="utf-8") as f:
+                arrangement = json.load(f)
+        else:
+            arrangement = json.loads(args.arrangement)
+        if not isinstance(arrangement, list) or not arrangement:
+            raise ValueError("arrangement vide ou invalide")
+
+        if args.out == "-":
+            render(arrangement, args.temp_dir, args.beat_id, sys.stdout.buffer, not args.no_tails)
+        else:
+            with open(args.out, "wb") as fh:
+                render(arrangement, args.temp_dir, args.beat_id, fh, not args.no_tails)
+            log_info("WAV :", args.out)
+        return 0
+    except Exception as e:
+        log_err("Arrangement :", e)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
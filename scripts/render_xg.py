@@ -1,5 +1,6 @@
 # scripts/render_xg.py
-import argparse, tempfile, os, subprocess, sys, shutil, hashlib
+import argparse, tempfile, os, subprocess, sys, shutil, hashlib, json, wave
+from concurrent.futures import ThreadPoolExecutor
 from mido import MidiFile, MidiTrack, Message, MetaMessage
 
 def log_info(*a):  print("ℹ️", *a, file=sys.stderr, flush=True)
@@ -110,13 +111,17 @@ def sha16(path):
         return h.hexdigest()[:16]
     except: return "?"
 
-def run_timidity_forced(sf2, mid, wav, sr=44100):
+# Aperçu rapide : mono, polyphonie réduite, interpolation linéaire, aucun effet
+PREVIEW_TIMIDITY_ARGS = ['--output-mono', '-p', '32', '-EFresamp=l', '-EFdelay=0', '-EFvlpf=d', '-EFns=0']
+
+def run_timidity_forced(sf2, mid, wav, sr=44100, preview=False):
     """
     Forçage strict:
       - écrit un .cfg minimal avec chemin SF2 entre guillemets
       - lance timidity avec -c <cfg> et -v (verbose)
       - vérifie dans la sortie que le SF2 est bien mentionné
       - retourne code 86 si la vérif échoue (anti-fallback)
+    preview=True : rendu dégradé mais rapide (PREVIEW_TIMIDITY_ARGS)
     """
     if which('timidity') is None:
         log_warn("timidity introuvable dans le PATH")
@@ -140,6 +145,8 @@ def run_timidity_forced(sf2, mid, wav, sr=44100):
 
     args = ['timidity', '-c', cfg_path, '-Ow', '-s', str(sr), '-o', wav,
             '-EFreverb=0', '-EFchorus=0', '-v', mid]
+    if preview:
+        args[-2:-2] = PREVIEW_TIMIDITY_ARGS
 
     proc, out, err = run_and_log(args, env=env)
 
@@ -155,6 +162,120 @@ def run_timidity_forced(sf2, mid, wav, sr=44100):
     except: pass
     return proc
 
+# Stems : groupes de parties d'un style (canaux 0-based = CH9..CH16 humains)
+STEM_GROUPS = {
+    "rhythm": (8, 9),     # Rhythm 1/2
+    "bass":   (10,),
+    "chord":  (11, 12),   # Chord 1/2
+    "pad":    (13,),
+    "phrase": (14, 15),   # Phrase 1/2
+}
+
+def keep_notes_only(mf: MidiFile, channels) -> MidiFile:
+    """Copie où seules les notes de 'channels' restent ; CC/PC/sysex de tous les canaux
+    sont conservés pour que chaque stem ait exactement le même état que le mix."""
+    out = MidiFile(ticks_per_beat=mf.ticks_per_beat)
+    for tr in mf.tracks:
+        nt = MidiTrack()
+        carry = 0
+        for m in tr:
+            if m.type in ('note_on', 'note_off') and m.channel not in channels:
+                carry += m.time
+                continue
+            nt.append(m.copy(time=m.time + carry))
+            carry = 0
+        out.tracks.append(nt)
+    return out
+
+def channels_with_notes(mf: MidiFile):
+    return {m.channel for tr in mf.tracks for m in tr if m.type == 'note_on' and m.velocity > 0}
+
+def fit_wav_frames(path, frames):
+    """Tronque / complète de silence à 'frames' échantillons exactement (alignement des stems)."""
+    with wave.open(path, 'rb') as w:
+        params = w.getparams()
+        data = w.readframes(frames)
+    width = params.nchannels * params.sampwidth
+    data = data + b'\x00' * (frames * width - len(data))
+    with wave.open(path, 'wb') as w:
+        w.setparams(params)
+        w.writeframes(data)
+
+def render_stems(mf: MidiFile, sf2, wav_out, sr, duration=None):
+    """Rend tous les groupes présents en parallèle ; même timeline (tick 0) pour tous."""
+    present = channels_with_notes(mf)
+    groups = {g: chs for g, chs in STEM_GROUPS.items() if present & set(chs)}
+    others = tuple(sorted(present - {c for chs in STEM_GROUPS.values() for c in chs}))
+    if others:
+        groups["other"] = others
+    base = os.path.splitext(wav_out)[0]
+
+    def one(item):
+        group, chs = item
+        fd, mid_tmp = tempfile.mkstemp(suffix=f'_{group}.mid'); os.close(fd)
+        wav = f"{base}_stem_{group}.wav"
+        try:
+            keep_notes_only(mf, set(chs)).save(mid_tmp)
+            p = run_timidity_forced(sf2, mid_tmp, wav, sr=sr)
+        finally:
+            try: os.remove(mid_tmp)
+            except: pass
+        if p.returncode != 0 or not os.path.isfile(wav):
+            raise RuntimeError(f"Rendu stem {group} échoué (code {p.returncode})")
+        return group, chs, wav
+
+    with ThreadPoolExecutor(max_workers=max(1, min(len(groups), os.cpu_count() or 1))) as ex:
+        done = list(ex.map(one, groups.items()))
+
+    if duration is None:
+        frames = 0
+        for _g, _c, wav in done:
+            with wave.open(wav, 'rb') as w:
+                frames = max(frames, w.getnframes())
+    else:
+        frames = int(round(float(duration) * sr))
+    for _g, _c, wav in done:
+        fit_wav_frames(wav, frames)
+    log_ok(f"{len(done)} stem(s) alignés sur {frames} échantillons")
+    return [{"group": g, "channels": list(c), "wav": w} for g, c, w in done]
+
+def render_segmented(mf: MidiFile, args) -> bool:
+    """Rendu parallèle par segments de mesures (segment_render.py) ; False → repli série."""
+    from segment_render import render_parallel, compare_wavs
+
+    def render_fn(mid, wav):
+        p = run_timidity_forced(args.sf2, mid, wav, sr=args.sr, preview=args.preview)
+        return p.returncode == 0 and os.path.isfile(wav)
+
+    try:
+        n = render_parallel(mf, args.wav_out, render_fn, args.sr, args.parallel_segments,
+                            tail_sec=args.segment_tail, log=log_ok)
+    except Exception as e:
+        log_warn("Rendu par segments échoué, repli série :", e)
+        return False
+    if n < 2 or not args.segment_verify:
+        return True
+
+    # Vérification : écart avec un rendu série de la même timeline
+    fd, mid_fixed = tempfile.mkstemp(suffix='_xg.mid'); os.close(fd)
+    serial_wav = args.wav_out + ".serial.wav"
+    try:
+        mf.save(mid_fixed)
+        if not render_fn(mid_fixed, serial_wav):
+            log_warn("Vérification : rendu série échoué, sortie segmentée conservée")
+            return True
+        db = compare_wavs(args.wav_out, serial_wav)
+        if db > args.segment_tol_db:
+            log_warn(f"Segments vs série : {db:.1f} dB > {args.segment_tol_db} dB → rendu série conservé")
+            os.replace(serial_wav, args.wav_out)
+        else:
+            log_ok(f"Segments vs série : {db:.1f} dB (tolérance {args.segment_tol_db} dB)")
+        return True
+    finally:
+        for f in (mid_fixed, serial_wav):
+            try: os.remove(f)
+            except: pass
+
 def main():
     ap = argparse.ArgumentParser(description="Rendu WAV via TiMidity++ (XG setup + normalisation).")
     ap.add_argument('midi_in')
@@ -166,6 +287,21 @@ def main():
     ap.add_argument('--force-gm-drum', action='store_true', default=True,
                     help="Forcer CH10/11 (9/10 zero-based) en Standard GM Drum (PC=0). Défaut: ON.")
     ap.add_argument('--no-ffmpeg-fix', action='store_true')
+    ap.add_argument('--preview', action='store_true',
+                    help="Aperçu rapide : mono, polyphonie 32, sans effets (à combiner avec --sr 22050).")
+    ap.add_argument('--parallel-segments', type=int, default=1,
+                    help="Découper les timelines longues en N segments (aux mesures) rendus en parallèle.")
+    ap.add_argument('--segment-min-sec', type=float, default=16.0,
+                    help="Durée minimale (s) pour activer le rendu par segments.")
+    ap.add_argument('--segment-tail', type=float, default=2.0,
+                    help="Queue de release (s) gardée après la dernière note tenue d'un segment.")
+    ap.add_argument('--segment-verify', action='store_true',
+                    help="Comparer au rendu série ; au-delà de --segment-tol-db, le rendu série est gardé.")
+    ap.add_argument('--segment-tol-db', type=float, default=-30.0)
+    ap.add_argument('--stems', action='store_true',
+                    help="Rendre des stems groupés (<wav_out>_stem_<groupe>.wav) au lieu du mix ; JSON sur stdout.")
+    ap.add_argument('--stem-duration', type=float, default=None,
+                    help="Durée exacte (s) de chaque stem ; défaut : le plus long rendu.")
     args = ap.parse_args()
 
     if not os.path.isfile(args.midi_in):
@@ -184,8 +320,9 @@ def main():
         log_err("Échec lecture MIDI:", e); sys.exit(3)
 
     if not args.no_xg:
-        log_info("Prep : XG System On + CC7/10/11 + CC91/93 + RPN PB=2")
-        mf = ensure_xg_setup(mf, reverb=40, chorus=0, pb_range=2)
+        reverb = 0 if args.preview else 40
+        log_info(f"Prep : XG System On + CC7/10/11 + CC91/93 (reverb={reverb}) + RPN PB=2")
+        mf = ensure_xg_setup(mf, reverb=reverb, chorus=0, pb_range=2)
     if not args.no_reemit:
         log_info("Prep : réémission CC0/32/PC au tick 0 (hors drums)")
         mf = reemit_banks_programs_at_zero(mf, drum_channels=(9,10))
@@ -193,18 +330,29 @@ def main():
         log_info("Prep : CH10/11 → Standard GM Drum (PC=0), bank selects ignorés")
         mf = force_gm_drum(mf, drum_channels=(9,10))
 
-    fd, mid_fixed = tempfile.mkstemp(suffix='_xg.mid'); os.close(fd)
-    try:
-        mf.save(mid_fixed)
-        log_ok("MIDI préparé :", mid_fixed)
-    except Exception as e:
-        log_err("Échec sauvegarde MIDI préparé:", e); sys.exit(4)
+    if args.stems:
+        try:
+            stems = render_stems(mf, args.sf2, args.wav_out, args.sr, args.stem_duration)
+        except Exception as e:
+            log_err("Stems :", e); sys.exit(5)
+        print(json.dumps({"stems": stems}))
+        return
 
-    # Rendu TiMidity (anti-fallback)
-    p = run_timidity_forced(args.sf2, mid_fixed, args.wav_out, sr=args.sr)
+    if args.parallel_segments > 1 and mf.length >= args.segment_min_sec and render_segmented(mf, args):
+        p = subprocess.CompletedProcess(args=[], returncode=0)
+    else:
+        fd, mid_fixed = tempfile.mkstemp(suffix='_xg.mid'); os.close(fd)
+        try:
+            mf.save(mid_fixed)
+            log_ok("MIDI préparé :", mid_fixed)
+        except Exception as e:
+            log_err("Échec sauvegarde MIDI préparé:", e); sys.exit(4)
 
-    try: os.remove(mid_fixed)
-    except: pass
+        # Rendu TiMidity (anti-fallback)
+        p = run_timidity_forced(args.sf2, mid_fixed, args.wav_out, sr=args.sr, preview=args.preview)
+
+        try: os.remove(mid_fixed)
+        except: pass
 
     if p.returncode != 0 or not os.path.isfile(args.wav_out) or os.path.getsize(args.wav_out) == 0:
         log_err("Rendu audio échoué. Code:", p.returncode)
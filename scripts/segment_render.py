@@ -0,0 +1,228 @@
+# scripts/segment_render.py
+"""
+Rendu parallèle par segments temporels (utilisé par render_xg.py).
+
+Une timeline longue est découpée aux barres de mesure en N segments rendus en
+parallèle (un process TiMidity par segment), puis recollés à l'échantillon près :
+
+- Amorçage : chaque segment rejoue au tick 0 tout l'état de canal antérieur
+  (sysex, bank/program, contrôleurs dont sustain/RPN, pitch bend) dans l'ordre
+  d'origine, plus le dernier tempo / signature / tonalité.
+- Recouvrement : pour les canaux dont des notes sont encore tenues à sa fin, un
+  segment garde tous les événements de canal suivants (note_off, sustain, volume /
+  expression, pitch bend, autres contrôleurs, aftertouch) et les changements de
+  tempo jusqu'au relâchement ; sa queue de release continue sur le segment suivant
+  pendant 'tail_sec' après la dernière de ces fins.
+- Recollage : overlap-add à offset exact (grille tempo), fondu cosinus de
+  'fade_ms' en fin de queue pour ne jamais couper net.
+- Vérification optionnelle contre un rendu série (écart RMS relatif en dB). Le
+  début de chaque segment est arrondi à l'échantillon : ce déphasage (≤ ½ échantillon)
+  domine l'écart, autour de -35 dB avec le synthé stub des tests de charge pour
+  4 segments ; d'où la tolérance par défaut de -30 dB dans render_xg.py.
+"""
+import math, os, tempfile, wave
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from mido import MidiFile, MidiTrack, merge_tracks
+
+STATE_META = ('set_tempo', 'time_signature', 'key_signature')
+
+def _abs_events(mf):
+    t, out = 0, []
+    for m in merge_tracks(mf.tracks):
+        t += m.time
+        out.append((t, m))
+    return out
+
+def _tick_to_sec(events, tpb):
+    """Fonction tick → secondes selon la carte de tempo."""
+    changes = [(0, 500000)]
+    for t, m in events:
+        if m.is_meta and m.type == 'set_tempo':
+            if t == changes[-1][0]:
+                changes[-1] = (t, m.tempo)
+            else:
+                changes.append((t, m.tempo))
+    starts = [0.0]
+    for (t0, tempo), (t1, _) in zip(changes, changes[1:]):
+        starts.append(starts[-1] + (t1 - t0) * tempo / (tpb * 1e6))
+
+    def conv(tick):
+        i = max(k for k, (t, _) in enumerate(changes) if t <= tick)
+        return starts[i] + (tick - changes[i][0]) * changes[i][1] / (tpb * 1e6)
+    return conv
+
+def bar_ticks(events, tpb):
+    ts = next((m for _t, m in events if m.is_meta and m.type == 'time_signature'), None)
+    num, den = (ts.numerator, ts.denominator) if ts else (4, 4)
+    return int(tpb * num * 4 / den)
+
+def plan_segments(events, tpb, n_segments):
+    """Bornes [a, b) en ticks, alignées sur les mesures."""
+    bar = bar_ticks(events, tpb)
+    end = events[-1][0] if events else 0
+    n_bars = max(1, math.ceil(end / bar))
+    n = max(1, min(n_segments, n_bars))
+    bounds = [round(i * n_bars / n) * bar for i in range(n)] + [max(end + 1, n_bars * bar)]
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+def build_segment(events, tpb, a, b):
+    """MidiFile du segment [a, b) : amorçage d'état + événements + fins des notes tenues.
+    Retourne (midi, tick de la dernière fin de note tenue au-delà de b)."""
+    prime, last_meta = [], {}
+    active = {}                 # (ch, note) -> nb
+    sustain = {}                # ch -> pédale enfoncée
+    for t, m in events:
+        if t >= a:
+            break
+        if m.is_meta:
+            if m.type in STATE_META:
+                last_meta[m.type] = m
+        elif m.type in ('note_on', 'note_off'):
+            continue
+        else:
+            prime.append(m)
+            if m.type == 'control_change' and m.control == 64:
+                sustain[m.channel] = m.value >= 64   # pédale enfoncée avant a : encore tenue dans le segment
+
+    body = []
+    for t, m in events:
+        if t < a:
+            continue
+        if t >= b:
+            break
+        if m.is_meta and m.type not in STATE_META:
+            continue
+        body.append((t - a, m))
+        if m.type == 'note_on' and m.velocity > 0:
+            active[(m.channel, m.note)] = active.get((m.channel, m.note), 0) + 1
+        elif m.type in ('note_on', 'note_off'):
+            if active.get((m.channel, m.note), 0) > 1:
+                active[(m.channel, m.note)] -= 1
+            else:
+                active.pop((m.channel, m.note), None)
+        elif m.type == 'control_change' and m.control == 64:
+            sustain[m.channel] = m.value >= 64
+
+    # Après b, jusqu'au relâchement des notes encore tenues : leurs note_off / relâchés
+    # de sustain, et toute l'automation de leurs canaux (CC7/11, pitch bend, ...)
+    release_end = b
+    pedal = {ch for ch, down in sustain.items() if down}
+    for t, m in events:
+        if t < b:
+            continue
+        if not active and not pedal:
+            break
+        if m.is_meta:
+            if m.type in STATE_META:
+                body.append((t - a, m))
+            continue
+        if not hasattr(m, 'channel'):
+            continue
+        live = pedal | {ch for ch, _n in active}
+        if m.channel not in live:
+            continue
+        if m.type == 'note_off' or (m.type == 'note_on' and m.velocity == 0):
+            if (m.channel, m.note) in active:
+                if active[(m.channel, m.note)] > 1:
+                    active[(m.channel, m.note)] -= 1
+                else:
+                    active.pop((m.channel, m.note))
+                body.append((t - a, m))
+                release_end = t
+        elif m.type == 'note_on':
+            continue    # nouvelle note : jouée par le segment suivant
+        elif m.type == 'control_change' and m.control == 64:
+            body.append((t - a, m))
+            if m.value < 64 and m.channel in pedal:
+                pedal.discard(m.channel)
+                release_end = t
+        else:
+            body.append((t - a, m))
+
+    tr = MidiTrack()
+    for k in STATE_META:
+        if k in last_meta:
+            tr.append(last_meta[k].copy(time=0))
+    for m in prime:
+        tr.append(m.copy(time=0))
+    last = 0
+    for t, m in sorted(body, key=lambda x: x[0]):
+        tr.append(m.copy(time=t - last))
+        last = t
+    out = MidiFile(ticks_per_beat=tpb)
+    out.tracks.append(tr)
+    return out, release_end
+
+def _read_pcm(path):
+    with wave.open(path, 'rb') as w:
+        p = w.getparams()
+        pcm = np.frombuffer(w.readframes(p.nframes), dtype='<i2').reshape(-1, p.nchannels)
+    return pcm, p.framerate
+
+def _write_pcm(path, pcm, sr):
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(pcm.shape[1])
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(pcm.astype('<i2').tobytes())
+
+def render_parallel(mf, wav_out, render_fn, sr, n_segments, tail_sec=2.0, fade_ms=30, log=print):
+    """render_fn(mid_path, wav_path) -> bool. Retourne le nombre de segments rendus."""
+    events = _abs_events(mf)
+    tpb = mf.ticks_per_beat
+    to_sec = _tick_to_sec(events, tpb)
+    segs = plan_segments(events, tpb, n_segments)
+    tmpdir = tempfile.mkdtemp(prefix='seg_')
+
+    def one(i_ab):
+        i, (a, b) = i_ab
+        mid_i, rel_end = build_segment(events, tpb, a, b)
+        mid_p, wav_p = os.path.join(tmpdir, f'{i}.mid'), os.path.join(tmpdir, f'{i}.wav')
+        mid_i.save(mid_p)
+        if not render_fn(mid_p, wav_p):
+            raise RuntimeError(f'Rendu segment {i} échoué')
+        keep = to_sec(rel_end) - to_sec(a) + tail_sec
+        return i, a, wav_p, keep
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(segs)) as ex:
+            parts = sorted(ex.map(one, enumerate(segs)))
+
+        out, ch = None, None
+        fade = max(1, int(sr * fade_ms / 1000))
+        for i, a, wav_p, keep in parts:
+            pcm, seg_sr = _read_pcm(wav_p)
+            if seg_sr != sr:
+                raise RuntimeError(f'SR inattendu {seg_sr} ≠ {sr}')
+            seg = pcm.astype(np.float32)
+            if i < len(parts) - 1:
+                n = min(len(seg), int(round(keep * sr)))
+                seg = seg[:n]
+                f = min(fade, n)
+                seg[n - f:] *= (0.5 + 0.5 * np.cos(np.linspace(0, np.pi, f)))[:, None]
+            off = int(round(to_sec(a) * sr))
+            if out is None:
+                ch = seg.shape[1]
+                out = np.zeros((off + len(seg), ch), np.float32)
+            if off + len(seg) > len(out):
+                out = np.concatenate([out, np.zeros((off + len(seg) - len(out), ch), np.float32)])
+            out[off:off + len(seg)] += seg
+        _write_pcm(wav_out, np.clip(np.round(out), -32768, 32767), sr)
+        log(f'{len(parts)} segment(s) recollés → {len(out) / sr:.2f}s')
+        return len(parts)
+    finally:
+        for f in os.listdir(tmpdir):
+            os.remove(os.path.join(tmpdir, f))
+        os.rmdir(tmpdir)
+
+def compare_wavs(a_path, b_path):
+    """Écart RMS relatif (dB) entre deux rendus ; -inf si identiques."""
+    a, _ = _read_pcm(a_path)
+    b, _ = _read_pcm(b_path)
+    n = max(len(a), len(b))
+    a = np.pad(a.astype(np.float64), ((0, n - len(a)), (0, 0)))
+    b = np.pad(b.astype(np.float64), ((0, n - len(b)), (0, 0)))
+    ref = np.sqrt(np.mean(b ** 2)) or 1.0
+    err = np.sqrt(np.mean((a - b) ** 2))
+    return 20 * math.log10(err / ref) if err > 0 else float('-inf')
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# scripts/sequencer.py
+"""
+Séquenceur MIDI temps réel (sans rendu audio) piloté par le manifest.
+
+- Charge une seule fois toutes les sections (.mid) en tableaux compacts triés
+  (temps en secondes + octets MIDI), boucles calées sur un nombre entier de mesures.
+- Ordonnance les événements sur une horloge haute résolution (perf_counter) :
+  chaque échéance est absolue depuis t0 → pas de dérive cumulée.
+- Les changements Main/Fill/Ending prennent effet à la prochaine barre de mesure
+  (en tenant compte de quantizeLeadMs du manifest).
+- Mesure la gigue d'ordonnancement (écart réel - prévu) et la rapporte.
+- Si le manifest décrit un sprite (pack_sprite.py) présent dans --dir, les MIDI
+  de sections y sont lus par offset (un seul fichier au lieu d'un .mid par section).
+
+Usage :
+  python3 sequencer.py manifest.json --dir temp --list-ports
+  python3 sequencer.py manifest.json --dir temp --port 0 --start "Main A"
+  python3 sequencer.py manifest.json --dir temp --virtual --start "Intro A"
+  python3 sequencer.py manifest.json --dir temp --memory --seconds 8
+
+Commandes sur stdin pendant la lecture : "main B", "fill", "intro A",
+"ending A", "stop". Rapport de gigue JSON sur stdout en fin de lecture.
+"""
+import argparse, io, json, math, os, sys, threading, time
+from array import array
+from collections import deque
+from mido import MidiFile
+from pack_sprite import read_section_midi
+
+def log_info(*a):  print("ℹ️", *a, file=sys.stderr, flush=True)
+def log_warn(*a):  print("⚠️", *a, file=sys.stderr, flush=True)
+
+SPIN_S = 0.0015        # fin d'attente en attente active (précision sub-ms)
+ALL_CHANNELS = range(16)
+
+# ---------------- Sections ----------------
+class Section:
+    """Timeline compacte : times[i] (s depuis le début), 3 octets MIDI par événement."""
+    __slots__ = ("name", "loop", "times", "data", "sizes", "length")
+
+    def __init__(self, name, loop, times, data, sizes, length):
+        self.name, self.loop = name, loop
+        self.times, self.data, self.sizes, self.length = times, data, sizes, length
+
+    def __len__(self):
+        return len(self.times)
+
+    def message(self, i):
+        return bytes(self.data[3 * i:3 * i + self.sizes[i]])
+
+def load_section(source, name, loop, bar_dur):
+    """source : chemin .mid ou octets MIDI (section lue dans un sprite)."""
+    times, data, sizes = array("d"), array("B"), array("B")
+    t = 0.0
+    mf = MidiFile(file=io.BytesIO(source)) if isinstance(source, (bytes, bytearray)) else MidiFile(source)
+    for msg in mf:   # pistes fusionnées, deltas en secondes, ordre chronologique
+        t += msg.time
+        if msg.is_meta or msg.type == "sysex":
+            continue
+        b = msg.bytes()
+        times.append(t)
+        data.extend(b + [0] * (3 - len(b)))
+        sizes.append(len(b))
+    bars = max(1, round(t / bar_dur)) if bar_dur > 0 else 1
+    length = bars * bar_dur if bar_dur > 0 else t
+    # Les clôtures de copy_section tombent pile sur la fin : on les garde à 'length'
+    for i in range(len(times)):
+        if times[i] > length:
+            times[i] = length
+    return Section(name, loop, times, data, sizes, length)
+
+# ---------------- Sorties ----------------
+class MemorySink:
+    """Sortie en mémoire (tests) : [(t_perf, bytes)]."""
+    def __init__(self):
+        self.events = []
+
+    def send(self, msg):
+        self.events.append((time.perf_counter(), msg))
+
+    def close(self):
+        pass
+
+class RtMidiSink:
+    """Port MIDI matériel / logiciel via python-rtmidi (ou port virtuel)."""
+    def __init__(self, port=None, virtual_name=None):
+        import rtmidi  # dépendance optionnelle (requirements.txt)
+        self.out = rtmidi.MidiOut()
+        if virtual_name:
+            self.out.open_virtual_port(virtual_name)
+        else:
+            ports = self.out.get_ports()
+            if not ports:
+                raise RuntimeError("Aucun port MIDI de sortie disponible")
+            idx = port if isinstance(port, int) else next(
+                (i for i, p in enumerate(ports) if port and port.lower() in p.lower()), 0)
+            self.out.open_port(idx)
+            log_info("Port MIDI :", ports[idx])
+
+    def send(self, msg):
+        self.out.send_message(msg)
+
+    def close(self):
+        self.out.close_port()
+
+def list_ports():
+    import rtmidi
+    return rtmidi.MidiOut().get_ports()
+
+# ---------------- Séquenceur ----------------
+class Sequencer:
+    def __init__(self, sections, bar_dur, sink, lead_ms=12, fill_map=None):
+        self.sections = sections
+        self.bar_dur = bar_dur
+        self.sink = sink
+        self.lead = lead_ms / 1000.0
+        self.fill_map = fill_map or {}
+        self.jitter = array("d")
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending = None          # liste de sections à enchaîner à la prochaine barre
+        self._stop = False
+
+    @classmethod
+    def from_manifest(cls, manifest, midi_dir, sink):
+        bar_dur = float(manifest.get("barDurSec") or 0) or \
+            (60.0 / (manifest.get("baseTempoBpm") or 120)) * (manifest.get("beatsPerBar") or 4)
+        sections = {}
+        sprite = manifest.get("sprite") or {}
+        sprite_path = os.path.join(midi_dir, sprite["file"]) if sprite.get("file") else None
+        if sprite_path and not os.path.isfile(sprite_path):
+            sprite_path = None
+        for s in manifest.get("sections", []):
+            off = s.get("sprite")
+            if sprite_path and off and off.get("midiLength"):
+                source = read_section_midi(sprite_path, off)
+            else:
+                source = os.path.join(midi_dir, s["midFilename"])
+                if not os.path.isfile(source):
+                    log_warn("Section absente :", source)
+                    continue
+            sections[s["section"]] = load_section(source, s["section"], bool(s.get("loop")), bar_dur)
+        if sprite_path:
+            log_info("Sections lues dans le sprite :", sprite_path)
+        log_info(f"{len(sections)} section(s) chargée(s), mesure = {bar_dur:.3f}s")
+        return cls(sections, bar_dur, sink, manifest.get("quantizeLeadMs", 12), manifest.get("fillMap"))
+
+    # --- commandes (thread quelconque) ---
+    def _request(self, names):
+        names = [n for n in names if n in self.sections or n.startswith("__")]
+        with self._lock:
+            self._pending = names or None
+        self._wake.set()
+
+    def main(self, letter):
+        target = f"Main {letter.upper()}"
+        self._request([self.fill_map.get(target, f"Fill In {letter.upper() * 2}"), target])
+
+    def fill(self):
+        self._request(["__fill__"])
+
+    def intro(self, letter):
+        self._request([f"Intro {letter.upper()}"])
+
+    def ending(self, letter):
+        self._request([f"Ending {letter.upper()}", "__end__"])
+
+    def stop(self):
+        with self._lock:
+            self._stop = True
+        self._wake.set()
+
+    # --- moteur ---
+    def _after(self, sec):
+        """Section qui suit un one-shot terminé sans demande en attente."""
+        if sec.loop:
+            return sec
+        kind, _, letter = sec.name.rpartition(" ")
+        if kind == "Intro":
+            return self.sections.get(f"Main {letter}")
+        if kind == "Fill In":
+            return self.sections.get(f"Main {letter[0]}")
+        return None   # Ending → fin
+
+    def _wait_until(self, target):
+        """Attend jusqu'à target ; True si une commande (bascule, stop) est arrivée entre-temps."""
+        while True:
+            left = target - time.perf_counter()
+            if left <= 0:
+                return False
+            if left > SPIN_S and self._wake.wait(left - SPIN_S):
+                self._wake.clear()
+                with self._lock:
+                    if self._pending is not None or self._stop:
+                        return True   # réévaluer
+                # drapeau résiduel sans commande : on continue jusqu'à l'échéance
+            # attente active pour la dernière fraction de milliseconde
+
+    def _all_off(self, active):
+        for ch, note in active:
+            self.sink.send(bytes([0x80 | ch, note, 0]))
+        active.clear()
+
+    def run(self, start="Main A", seconds=None):
+        cur = self.sections.get(start)
+        if cur is None:
+            raise KeyError(f"Section inconnue : {start}")
+        t0 = time.perf_counter()
+        base, idx = 0.0, 0            # début de la section courante (s depuis t0), prochain événement
+        queue = deque()
+        switch_at = None
+        active = set()
+        log_info("▶️", cur.name)
+
+        while True:
+            self._wake.clear()
+            with self._lock:
+                if self._stop:
+                    break
+                pending, self._pending = self._pending, None
+            if pending is not None:
+                if pending == ["__fill__"]:
+                    letter = cur.name[-1]
+                    pending = [n for n in (self.fill_map.get(cur.name, f"Fill In {letter * 2}"), cur.name) if n in self.sections]
+                queue = deque(pending)
+                # prochaine barre, en laissant au moins 'lead' pour préparer la bascule
+                now = time.perf_counter() - t0
+                bars = math.ceil((now + self.lead - base) / self.bar_dur - 1e-9)
+                switch_at = min(base + max(bars, 0) * self.bar_dur, base + cur.length)
+
+            end_at = base + cur.length
+            next_ev = base + cur.times[idx] if idx < len(cur) else end_at
+            boundary = switch_at if switch_at is not None else end_at
+            if seconds is not None and min(next_ev, boundary) >= seconds:
+                break
+
+            # à une bascule en cours de section, les événements pile sur la barre sont pour la suivante
+            if idx < len(cur) and (next_ev < boundary or (switch_at is None and next_ev <= boundary)):
+                if self._wait_until(t0 + next_ev):
+                    continue
+                msg = cur.message(idx)
+                self.sink.send(msg)
+                self.jitter.append(time.perf_counter() - (t0 + next_ev))
+                status = msg[0] & 0xF0
+                if status == 0x90 and msg[2] > 0:
+                    active.add((msg[0] & 0x0F, msg[1]))
+                elif status in (0x80, 0x90):
+                    active.discard((msg[0] & 0x0F, msg[1]))
+                idx += 1
+                continue
+
+            # barre de bascule ou fin de section
+            if self._wait_until(t0 + boundary):
+                continue
+            self._all_off(active)
+            switch_at = None
+            if queue:
+                name = queue.popleft()
+                nxt = self.sections.get(name)   # "__end__" → None : fin après l'Ending
+            else:
+                nxt = self._after(cur)
+            if nxt is None:
+                break
+            cur = nxt
+            base, idx = boundary, 0
+            log_info("▶️", cur.name, f"@ {base:.3f}s")
+
+        for ch in ALL_CHANNELS:   # All Notes Off
+            self.sink.send(bytes([0xB0 | ch, 123, 0]))
+        return self.report()
+
+    def report(self):
+        if not self.jitter:
+            return {"events": 0}
+        js = sorted(abs(j) * 1000.0 for j in self.jitter)
+        pct = lambda p: js[min(len(js) - 1, int(p / 100.0 * len(js)))]
+        return {
+            "events": len(js),
+            "meanMs": round(sum(js) / len(js), 4),
+            "p50Ms": round(pct(50), 4),
+            "p95Ms": round(pct(95), 4),
+            "p99Ms": round(pct(99), 4),
+            "maxMs": round(js[-1], 4),
+        }
+
+# ---------------- CLI ----------------
+def _stdin_commands(seq):
+    for line in sys.stdin:
+        parts = line.strip().split()
+        if not parts:
+            continue
+        cmd, arg = parts[0].lower(), (parts[1] if len(parts) > 1 else "A")
+        if cmd == "main":     seq.main(arg)
+        elif cmd == "fill":   seq.fill()
+        elif cmd == "intro":  seq.intro(arg)
+        elif cmd == "ending": seq.ending(arg)
+        elif cmd == "stop":   seq.stop(); return
+
+def main():
+    ap = argparse.ArgumentParser(description="Séquenceur MIDI live (bascule de sections à la mesure).")
+    ap.add_argument("manifest")
+    ap.add_argument("--dir", default=".", help="dossier des .mid de sections")
+    ap.add_argument("--port", default=None, help="index ou nom (partiel) du port de sortie")
+    ap.add_argument("--virtual", action="store_true", help="ouvrir un port virtuel 'PSR Sequencer'")
+    ap.add_argument("--memory", action="store_true", help="sortie en mémoire (tests, pas de MIDI)")
+    ap.add_argument("--list-ports", action="store_true")
+    ap.add_argument("--start", default="Main A")
+    ap.add_argument("--seconds", type=float, default=None)
+    args = ap.parse_args()
+
+    if args.list_ports:
+        print(json.dumps({"ports": list_ports()}, ensure_ascii=False))
+        return 0
+
+    with open(args.manifest, encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    if args.memory:
+        sink = MemorySink()
+    else:
+        port = int(args.port) if args.port and args.port.isdigit() else args.port
+        sink = RtMidiSink(port=port, virtual_name="PSR Sequencer" if args.virtual else None)
+
+    seq = Sequencer.from_manifest(manifest, args.dir, sink)
+    if not args.memory:
+        threading.Thread(target=_stdin_commands, args=(seq,), daemon=True).start()
+    try:
+        report = seq.run(args.start, seconds=args.seconds)
+    except KeyboardInterrupt:
+        report = seq.report()
+    finally:
+        sink.close()
+    print(json.dumps({"jitter": report}))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -67,6 +67,10 @@ app.use('/soundfonts', express.static(path.join(__dirname, 'soundfonts')));
 // ** AJOUT SERVIR DOSSIER TEMP **  
 app.use('/temp', express.static(path.join(__dirname, 'temp')));
 
+// Artefacts rendus immuables (niveau chaud disque → bucket), cache 1 an + ETag + Range
+const { getArtifactStore, serveArtifacts } = require('./utils/artifactStore');
+app.use('/artifacts', serveArtifacts(getArtifactStore()));
+
 // ✅ Dossiers auto-créés au démarrage
 ['uploads', 'temp'].forEach((dir) => {
   const fullPath = path.join(__dirname, dir);
@@ -0,0 +1,186 @@
+// test/artifactStore.test.js
+// node --test : niveau froid local, Range, repli chaud → froid.
+const test = require('node:test');
+const assert = require('node:assert');
+const fs = require('fs');
+const os = require('os');
+const path = require('path');
+const {
+  ArtifactStore, FsColdStore, SupabaseColdStore, contentKey, parseRange, serveArtifacts
+} = require('../utils/artifactStore');
+
+const dirs = [];
+test.after(() => dirs.forEach(d => fs.rmSync(d, { recursive: true, force: true })));
+
+function tmpDir() {
+  const d = fs.mkdtempSync(path.join(os.tmpdir(), 'artifacts-'));
+  dirs.push(d);
+  return d;
+}
+
+function newStore() {
+  const root = tmpDir();
+  const cold = new FsColdStore(path.join(root, 'cold'));
+  return { root, cold, store: new ArtifactStore({ hotDir: path.join(root, 'hot'), cold }) };
+}
+
+function writeSource(root, name, content) {
+  const p = path.join(root, name);
+  fs.writeFileSync(p, content);
+  return p;
+}
+
+// Réponse Express minimale pour le middleware
+function fakeRes() {
+  const res = {
+    statusCode: 200,
+    headers: {},
+    body: null,
+    headersSent: false,
+    setHeader(k, v) { this.headers[k.toLowerCase()] = v; },
+    status(c) { this.statusCode = c; return this; },
+    json(o) { this.body = o; this.headersSent = true; this.done(); return this; },
+    end(b) { this.body = b; this.headersSent = true; this.done(); return this; },
+    sendFile: null
+  };
+  res.finished = new Promise(r => { res.done = r; });
+  return res;
+}
+
+test('FsColdStore : put / get / list / remove / removePrefix', async () => {
+  const cold = new FsColdStore(path.join(tmpDir(), 'cold'));
+  await cold.put('7/a.0123456789abcdef.wav', Buffer.from('A'));
+  await cold.put('7/b.0123456789abcdef.mid', Buffer.from('B'));
+  await cold.put('7/a.0123456789abcdef.wav', Buffer.from('autre')); // clé existante : conservée
+
+  assert.strictEqual((await cold.get('7/a.0123456789abcdef.wav')).toString(), 'A');
+  assert.strictEqual(await cold.get('7/absent.0123456789abcdef.wav'), null);
+  assert.deepStrictEqual((await cold.list(7)).sort(), ['7/a.0123456789abcdef.wav', '7/b.0123456789abcdef.mid']);
+  assert.deepStrictEqual(await cold.list(8), []);
+
+  await cold.remove(['7/b.0123456789abcdef.mid']);
+  assert.deepStrictEqual(await cold.list(7), ['7/a.0123456789abcdef.wav']);
+  await cold.removePrefix(7);
+  assert.deepStrictEqual(await cold.list(7), []);
+  assert.strictEqual(cold.publicUrl('7/a.0123456789abcdef.wav'), null);
+});
+
+test('SupabaseColdStore : list() paginé (limit / offset) et suppression par lots', async () => {
+  const objects = Array.from({ length: 250 }, (_, i) => ({ name: `o${String(i).padStart(3, '0')}.0123456789abcdef.wav` }));
+  const removed = [];
+  const cold = new SupabaseColdStore('test');
+  cold.client = {
+    storage: {
+      from: () => ({
+        list: async (prefix, { limit, offset }) => ({ data: objects.slice(offset, offset + limit), error: null }),
+        remove: async keys => { removed.push(keys); return { error: null }; }
+      })
+    }
+  };
+  const keys = await cold.list(9);
+  assert.strictEqual(keys.length, 250);
+  assert.strictEqual(keys[249], '9/o249.0123456789abcdef.wav');
+
+  await cold.removePrefix(9);
+  assert.deepStrictEqual(removed.map(b => b.length), [100, 100, 50]);
+});
+
+test('parseRange', () => {
+  assert.deepStrictEqual(parseRange('bytes=0-9', 100), { start: 0, end: 9 });
+  assert.deepStrictEqual(parseRange('bytes=90-', 100), { start: 90, end: 99 });
+  assert.deepStrictEqual(parseRange('bytes=-10', 100), { start: 90, end: 99 });
+  assert.deepStrictEqual(parseRange('bytes=-500', 100), { start: 0, end: 99 });
+  assert.deepStrictEqual(parseRange('bytes=50-500', 100), { start: 50, end: 99 });
+  assert.strictEqual(parseRange('bytes=100-', 100), 'unsatisfiable');
+  assert.strictEqual(parseRange('bytes=9-5', 100), 'unsatisfiable');
+  assert.strictEqual(parseRange('bytes=-', 100), null);
+  assert.strictEqual(parseRange('bytes=0-1,5-6', 100), null);
+  assert.strictEqual(parseRange('items=0-1', 100), null);
+  assert.strictEqual(parseRange(undefined, 100), null);
+});
+
+test('putFile : clé par hash, même contenu → même clé', async () => {
+  const { root, cold, store } = newStore();
+  const v1 = await store.putFile(3, writeSource(root, '3_Main_A.wav', 'v1'));
+  assert.strictEqual(v1.key, contentKey(3, '3_Main_A.wav', Buffer.from('v1')));
+  assert.ok(fs.existsSync(store.hotPath(v1.key)));
+
+  const v2 = await store.putFile(3, writeSource(root, '3_Main_A.wav', 'v2'));
+  assert.notStrictEqual(v2.key, v1.key);
+  assert.deepStrictEqual((await cold.list(3)).sort(), [v1.key, v2.key].sort()); // nettoyage : removeSuperseded
+
+  const again = await store.putFile(3, writeSource(root, '3_Main_A.wav', 'v2'));
+  assert.strictEqual(again.key, v2.key);
+});
+
+test('removeSuperseded : un seul listing, versions précédentes supprimées aux deux niveaux sauf clés conservées', async () => {
+  const { root, cold, store } = newStore();
+  const a1 = await store.putFile(3, writeSource(root, '3_Main_A.wav', 'a1'));
+  const b1 = await store.putFile(3, writeSource(root, '3_Main_B.wav', 'b1'));
+  const stem = await store.putFile(3, writeSource(root, '3_Main_A_stem_bass.wav', 'bass'));
+  const a2 = await store.putFile(3, writeSource(root, '3_Main_A.wav', 'a2'));
+  const b2 = await store.putFile(3, writeSource(root, '3_Main_B.wav', 'b2'));
+
+  let lists = 0;
+  const list = cold.list.bind(cold);
+  cold.list = prefix => { lists++; return list(prefix); };
+
+  const removed = await store.removeSuperseded(3, [a2.key, b2.key], new Set([b1.key]));
+  assert.strictEqual(lists, 1);
+  assert.deepStrictEqual(removed, [a1.key]);
+  assert.ok(!fs.existsSync(store.hotPath(a1.key)));
+  assert.strictEqual(await cold.get(a1.key), null);
+  assert.deepStrictEqual((await list(3)).sort(), [a2.key, b1.key, b2.key, stem.key].sort());
+  assert.deepStrictEqual(await store.removeSuperseded(3, []), []);
+});
+
+test('read : niveau froid quand le fichier chaud manque, puis remplissage du niveau chaud', async () => {
+  const { root, store } = newStore();
+  const { key } = await store.putFile(4, writeSource(root, '4_Main_B.wav', 'contenu'));
+  assert.deepStrictEqual(await store.read(key), { hotPath: store.hotPath(key) });
+
+  fs.unlinkSync(store.hotPath(key));
+  const hit = await store.read(key);
+  assert.strictEqual(hit.buffer.toString(), 'contenu');
+  await store.filling.get(key);
+  assert.ok(fs.existsSync(store.hotPath(key)));
+
+  assert.strictEqual((await store.read(key, { skipHot: true })).buffer.toString(), 'contenu');
+  assert.strictEqual(await store.read('4/absent.0123456789abcdef.wav'), null);
+});
+
+test('serveArtifacts : fichier chaud évincé pendant sendFile → niveau froid (Range)', async () => {
+  const { root, store } = newStore();
+  const { key, etag } = await store.putFile(5, writeSource(root, '5_Main_C.wav', '0123456789'));
+  const res = fakeRes();
+  res.sendFile = (p, opts, cb) => {
+    fs.unlinkSync(p);
+    const err = new Error('ENOENT');
+    err.code = 'ENOENT';
+    cb(err);
+  };
+  const req = { method: 'GET', path: `/${key}`, headers: { range: 'bytes=2-5' } };
+  await serveArtifacts(store)(req, res, err => { throw err || new Error('next() inattendu'); });
+  await res.finished;
+
+  assert.strictEqual(res.statusCode, 206);
+  assert.strictEqual(res.body.toString(), '2345');
+  assert.strictEqual(res.headers['content-range'], 'bytes 2-5/10');
+  assert.strictEqual(res.headers.etag, `"${etag}"`);
+  assert.match(res.headers['cache-control'], /immutable/);
+});
+
+test('serveArtifacts : 304 sur If-None-Match, 404 sur clé invalide', async () => {
+  const { root, store } = newStore();
+  const { key, etag } = await store.putFile(6, writeSource(root, '6_Main_D.wav', 'x'));
+  fs.unlinkSync(store.hotPath(key));
+
+  const res = fakeRes();
+  await serveArtifacts(store)({ method: 'GET', path: `/${key}`, headers: { 'if-none-match': `"${etag}"` } }, res, () => {});
+  await res.finished;
+  assert.strictEqual(res.statusCode, 304);
+
+  const bad = fakeRes();
+  await serveArtifacts(store)({ method: 'GET', path: '/../etc/passwd', headers: {} }, bad, () => {});
+  assert.strictEqual(bad.statusCode, 404);
+});
@@ -0,0 +1,125 @@
+// test/prepareQueue.test.js
+// node --test : ordre des priorités, promotion, éviction, retrait, relance d'un beat mis à jour.
+const test = require('node:test');
+const assert = require('node:assert');
+const { PrepareQueue, PRIORITY } = require('../utils/prepareQueue');
+
+// Charge CPU ignorée : seul l'ordre de la file est testé
+function newQueue(opts = {}) {
+  return new PrepareQueue({ maxLoad: 1e9, pollMs: 5, ...opts });
+}
+
+async function drain(q) {
+  while (q.jobs.size || q.running.size) await new Promise(r => setTimeout(r, 1));
+}
+
+// Runner qui enregistre l'ordre des rendus ; gates[beatId] bloque un rendu jusqu'à release()
+function recorder() {
+  const order = [];
+  const gates = {};
+  return {
+    order,
+    hold(beatId) {
+      let release;
+      gates[beatId] = { promise: new Promise(r => { release = r; }), release: () => release() };
+      return gates[beatId];
+    },
+    run: async beatId => {
+      order.push(beatId);
+      const gate = gates[beatId];
+      if (gate) {
+        delete gates[beatId];
+        await gate.promise;
+      }
+    }
+  };
+}
+
+async function started(rec, count) {
+  while (rec.order.length < count) await new Promise(r => setTimeout(r, 1));
+}
+
+test('ordre : ouvert > populaire (score décroissant) > upload, puis ordre d\'arrivée', async () => {
+  const q = newQueue();
+  const rec = recorder();
+  q.enqueue(1, PRIORITY.UPLOAD);
+  q.enqueue(2, PRIORITY.POPULAR, 1);
+  q.enqueue(3, PRIORITY.POPULAR, 5);
+  q.enqueue(4, PRIORITY.OPENED);
+  q.enqueue(5, PRIORITY.UPLOAD);
+  q.enqueue(6, PRIORITY.UPLOAD);
+  assert.strictEqual(q.enqueue(5, PRIORITY.POPULAR, 3), true);   // dédoublonné, remonté
+  assert.strictEqual(q.enqueue(3, PRIORITY.UPLOAD), true);       // jamais rétrogradé
+  assert.strictEqual(q.jobs.size, 6);
+
+  q.setRunner(rec.run);
+  await drain(q);
+  assert.deepStrictEqual(rec.order, [4, 3, 5, 2, 1, 6]);
+  assert.strictEqual(q.stats().done, 6);
+});
+
+test('promote : un beat en file passe devant les jobs de fond', async () => {
+  const q = newQueue();
+  const rec = recorder();
+  q.enqueue(1, PRIORITY.POPULAR, 10);
+  q.enqueue(2, PRIORITY.UPLOAD);
+  assert.strictEqual(q.promote(2), true);
+  assert.strictEqual(q.promote(99), false);
+  assert.deepStrictEqual(q.stats().byPriority, { opened: 1, popular: 1, upload: 0 });
+
+  q.setRunner(rec.run);
+  await drain(q);
+  assert.deepStrictEqual(rec.order, [2, 1]);
+});
+
+test('file pleine : le moins prioritaire est écarté, égalité → nouveau job refusé', () => {
+  const q = newQueue({ maxQueue: 2 });
+  assert.strictEqual(q.enqueue(1, PRIORITY.UPLOAD), true);
+  assert.strictEqual(q.enqueue(2, PRIORITY.POPULAR), true);
+  assert.strictEqual(q.enqueue(3, PRIORITY.UPLOAD), false);          // égalité avec le job 1
+  assert.strictEqual(q.enqueue(4, PRIORITY.POPULAR, 1), true);       // écarte le job 1
+  assert.deepStrictEqual([...q.jobs.keys()].sort(), [2, 4]);
+  assert.strictEqual(q.enqueue(5, PRIORITY.UPLOAD, 100), false);     // priorité avant le score
+  assert.strictEqual(q.enqueue(2, PRIORITY.OPENED), true);           // déjà en file : pas d'éviction
+  assert.strictEqual(q.jobs.size, 2);
+
+  assert.strictEqual(newQueue({ enabled: false }).enqueue(1), false);
+});
+
+test('remove : retire de la file et annule la relance d\'un beat en cours', async () => {
+  const q = newQueue();
+  const rec = recorder();
+  q.enqueue(1);
+  q.enqueue(2);
+  assert.strictEqual(q.remove(1), true);
+  assert.strictEqual(q.remove(1), false);
+
+  const gate = rec.hold(2);
+  q.setRunner(rec.run);
+  await started(rec, 1);
+  q.enqueue(2);                   // mise à jour pendant le rendu → relance prévue
+  q.remove(2);                    // beat supprimé : plus de relance
+  gate.release();
+  await drain(q);
+  assert.deepStrictEqual(rec.order, [2]);
+});
+
+test('beat ré-enfilé pendant son rendu : relancé une fois à la fin, avec la meilleure priorité', async () => {
+  const q = newQueue();
+  const rec = recorder();
+  const gate = rec.hold(7);
+  q.enqueue(7, PRIORITY.UPLOAD);
+  q.setRunner(rec.run);
+  await started(rec, 1);
+
+  assert.strictEqual(q.enqueue(7, PRIORITY.UPLOAD), true);
+  assert.strictEqual(q.enqueue(7, PRIORITY.POPULAR, 2), true);
+  assert.strictEqual(q.jobs.size, 0);                            // pas de doublon en file
+  assert.deepStrictEqual(q.dirty.get(7), { priority: PRIORITY.POPULAR, score: 2 });
+  q.enqueue(8, PRIORITY.UPLOAD);
+
+  gate.release();
+  await drain(q);
+  assert.deepStrictEqual(rec.order, [7, 7, 8]);                  // relance populaire avant l'upload 8
+  assert.strictEqual(q.dirty.size, 0);
+});
@@ -0,0 +1,121 @@
+# test/test_casm.py
+# pytest : lecture des Ctab / Ctb2 du CASM et transposition des notes (NTR / NTT, limites).
+import os, struct, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+import casm  # noqa: E402
+from casm import (  # noqa: E402
+    NTR_GUITAR, NTR_ROOT_FIXED, NTR_ROOT_TRANS, NTT_BASS, NTT_BYPASS, NTT_CHORD, NTT_MELODY,
+    map_note,
+)
+
+ALL_CHORDS = (1 << len(casm.CHORD_TYPES)) - 1
+C, E, G, A, BB = 0, 4, 7, 9, 10
+MAJ, MAJ7, MIN = 0, 2, 8
+
+
+def ctab(src=11, name=b"Chord1", dest=11, note_mask=0xFFF, chord_mask=ALL_CHORDS,
+         src_root=C, src_chord=MAJ7, rules=(NTR_ROOT_TRANS, 2, 11, 0, 127, 0)):
+    """Ctab SFF1 construit à la main : 26 octets, règles en 20..25."""
+    return (bytes([src]) + name.ljust(8) + bytes([dest, 0, note_mask >> 8, note_mask & 0xFF])
+            + chord_mask.to_bytes(5, "big") + bytes([src_root, src_chord]) + bytes(rules))
+
+
+def chunk(cid, body):
+    return cid + struct.pack(">I", len(body)) + body
+
+
+def part(**kw):
+    p = {"src": 11, "dest": 11, "name": "", "note_mask": 0xFFF, "chord_mask": ALL_CHORDS,
+         "src_root": C, "src_chord": MAJ7, "ntr": NTR_ROOT_TRANS, "ntt": NTT_CHORD,
+         "high_key": 11, "low": 0, "high": 127}
+    p.update(kw)
+    return p
+
+
+# ---------------- Ctab ----------------
+def test_parse_ctab_fields():
+    p = casm._parse_ctab(ctab(src=10, name=b"Bass", dest=2, note_mask=0x0F0, chord_mask=0b101,
+                              src_root=14, src_chord=MIN, rules=(NTR_GUITAR, 0x80, 17, 28, 200, 0)), sff2=False)
+    assert p == {"src": 10, "name": "Bass", "dest": 2, "note_mask": 0x0F0, "chord_mask": 0b101,
+                 "src_root": 2, "src_chord": MIN, "ntr": NTR_GUITAR, "ntt": NTT_BASS,
+                 "high_key": 5, "low": 28, "high": 127}
+
+
+def test_parse_ctab_defaults_and_invalid_values():
+    p = casm._parse_ctab(ctab(note_mask=0, chord_mask=0, src_chord=99, rules=(7, 2, 11, 0, 127, 0)), sff2=False)
+    assert p["note_mask"] == 0xFFF            # masque vide → la partie joue pour toutes les notes
+    assert p["chord_mask"] == ALL_CHORDS
+    assert p["src_chord"] == MAJ7             # type hors table → CMaj7
+    assert p["ntr"] == NTR_ROOT_TRANS         # NTR inconnue
+    assert casm._parse_ctab(ctab()[:25], sff2=False) is None
+
+
+def test_parse_ctb2_reads_middle_range():
+    # Ctb2 : plage basse en 20..25, moyenne en 28..33
+    data = ctab(rules=(NTR_ROOT_FIXED, 0, 11, 0, 127, 0)) + bytes([0, 0]) + bytes([NTR_ROOT_TRANS, 2, 4, 36, 96, 0])
+    p = casm._parse_ctab(data, sff2=True)
+    assert (p["ntr"], p["ntt"], p["high_key"], p["low"], p["high"]) == (NTR_ROOT_TRANS, NTT_CHORD, 4, 36, 96)
+
+
+def test_decode_ntt():
+    assert casm._decode_ntt(0x00, False) == NTT_BYPASS
+    assert casm._decode_ntt(0x02, False) == NTT_CHORD
+    assert casm._decode_ntt(0x03, False) == NTT_BASS
+    assert casm._decode_ntt(0x03, True) == NTT_MELODY     # table mineure SFF2
+    assert casm._decode_ntt(0x81, True) == NTT_BASS       # bit 7 : bass on
+    assert casm._decode_ntt(0x01, False) == NTT_MELODY
+
+
+def test_parse_casm_after_midi_tracks():
+    midi = chunk(b"MThd", struct.pack(">HHH", 0, 1, 480)) + chunk(b"MTrk", b"\x00\xff\x2f\x00")
+    cseg = chunk(b"Sdec", b"Main A,Main B") + chunk(b"Ctab", ctab(src=9, rules=(NTR_ROOT_FIXED, 0, 11, 0, 127, 0)))
+    buf = midi + chunk(b"CASM", chunk(b"CSEG", cseg))
+    segs = casm.parse_casm(buf)
+    assert segs[0]["sections"] == ["Main A", "Main B"]
+    parts = casm.parts_for_section(segs, "Main B")
+    assert list(parts) == [9] and parts[9]["ntt"] == NTT_BYPASS
+    assert casm.parts_for_section(segs, "Intro A") is None
+    assert casm.parse_casm(midi) == []
+
+
+# ---------------- Transposition ----------------
+def test_bypass_fixed_part_never_moves():
+    drums = part(ntr=NTR_ROOT_FIXED, ntt=NTT_BYPASS)
+    assert [map_note(n, drums, G, MIN) for n in (36, 38, 42)] == [36, 38, 42]
+
+
+def test_chord_root_trans_follows_root_and_chord():
+    p = part()
+    assert map_note(64, p, G, MAJ) == 71     # E → B (tierce de G)
+    assert map_note(71, p, G, MAJ) == 79     # B (7e majeure) → fondamentale la plus proche → G
+    assert map_note(64, p, A, MIN) == 72     # E → C (tierce mineure de A)
+
+
+def test_root_trans_high_key_drops_an_octave():
+    assert map_note(64, part(high_key=5), G, MAJ) == 59    # G > high key F : transposé vers le bas
+
+
+def test_root_fixed_takes_nearest_shift():
+    assert map_note(64, part(ntr=NTR_ROOT_FIXED), BB, MAJ) == 62   # +10 → -2
+
+
+def test_bass_keeps_root_and_maps_other_tones():
+    bass = part(ntt=NTT_BASS)
+    assert map_note(48, bass, A, MIN) == 57      # fondamentale conservée
+    assert map_note(52, bass, A, MIN) == 60      # E → C
+
+
+def test_melody_passing_note_follows_lower_chord_tone():
+    mel = part(ntt=NTT_MELODY)
+    assert map_note(62, mel, C, MIN) == 62       # D : ton inférieur C inchangé
+    assert map_note(65, mel, C, MIN) == 64       # F : ton inférieur E → Eb, F suit d'un demi-ton
+    assert map_note(64, mel, C, MIN) == 63       # ton d'accord
+
+
+def test_note_limits_fold_by_octave():
+    assert map_note(71, part(low=60, high=72), G, MAJ) == 67       # 79 > high → octave en dessous
+    assert map_note(48, part(low=60, high=72), C, MAJ) == 60       # 48 < low → octave au-dessus
+    assert map_note(127, part(), G, MAJ) == 122                    # jamais au-delà de 127
+    assert map_note(71, part(low=60, high=65), G, MAJ) == 79       # plage < 1 octave : pas de repli
+    assert map_note(0, part(low=60, high=65, high_key=0), G, MIN) == 0   # borné à 0..127
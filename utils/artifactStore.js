@@ -0,0 +1,393 @@
+// utils/artifactStore.js
+// Stockage des artefacts rendus (WAV, MIDI, pics, stems, sprites) sur deux niveaux :
+//  - niveau chaud : disque local (ARTIFACT_HOT_DIR), servi directement ;
+//  - niveau froid : bucket Supabase `midiAndWav` (ou un dossier local, ARTIFACT_COLD_DIR, pour les tests).
+// Les noms d'objets contiennent le hash du contenu (`<beatId>/<nom>.<sha256:16>.<ext>`) :
+// un nom ne change jamais de contenu → Cache-Control immutable sur un an, ETag = hash.
+// En fin de re-rendu, removeSuperseded() supprime les versions précédentes (autre hash) des artefacts réécrits.
+const fs = require('fs');
+const path = require('path');
+const crypto = require('crypto');
+const { createClient } = require('@supabase/supabase-js');
+require('dotenv').config();
+
+const IMMUTABLE_MAX_AGE = 31536000; // 1 an (secondes)
+const KEY_RE = /^[\w-]+\/[\w.-]+\.([0-9a-f]{16})\.[a-z0-9]+$/i;
+const LIST_PAGE = 100; // taille de page de storage.list() (Supabase plafonne à 100 par défaut)
+
+const CONTENT_TYPES = {
+  '.wav': 'audio/wav',
+  '.mid': 'audio/midi',
+  '.json': 'application/json',
+  '.peaks': 'application/octet-stream'
+};
+
+function contentTypeFor(key) {
+  return CONTENT_TYPES[path.extname(key).toLowerCase()] || 'application/octet-stream';
+}
+
+/**
+ * Clé immuable d'un contenu : `<beatId>/<base>.<sha256:16><ext>`
+ * @param {string|number} beatId
+ * @param {string} filename - nom d'origine (ex. 12_Main_A.wav)
+ * @param {Buffer} buffer
+ */
+function contentKey(beatId, filename, buffer) {
+  const hash = crypto.createHash('sha256').update(buffer).digest('hex').slice(0, 16);
+  const ext = path.extname(filename);
+  return `${beatId}/${path.basename(filename, ext)}.${hash}${ext}`;
+}
+
+/** Même artefact (beat, nom, extension) sous un autre hash : `12/12_Main_A.<hash>.wav` ≡ `12/12_Main_A.<autre>.wav`. */
+function sameArtifact(a, b) {
+  const strip = k => k.replace(/\.[0-9a-f]{16}(\.[a-z0-9]+)$/i, '$1');
+  return a !== b && KEY_RE.test(a) && KEY_RE.test(b) && strip(a) === strip(b);
+}
+
+// ---------------- Niveaux froids ----------------
+
+/** Bucket Supabase (production). */
+class SupabaseColdStore {
+  constructor(bucket = 'midiAndWav') {
+    this.bucket = bucket;
+    this.client = createClient(process.env.SUPABASE_URL, process.env.SUPABASE_SERVICE_ROLE_KEY);
+  }
+
+  async put(key, buffer, contentType) {
+    const { error } = await this.client
+      .storage
+      .from(this.bucket)
+      .upload(key, buffer, { cacheControl: String(IMMUTABLE_MAX_AGE), upsert: false, contentType });
+    // Même clé = même contenu : un objet déjà présent est le bon
+    if (error && !/exists|duplicate/i.test(error.message || '')) throw error;
+  }
+
+  async get(key) {
+    const { data, error } = await this.client.storage.from(this.bucket).download(key);
+    if (error || !data) return null;
+    return Buffer.from(await data.arrayBuffer());
+  }
+
+  /** Toutes les clés sous `<prefix>/` (list() est paginé : limit / offset jusqu'à page vide). */
+  async list(prefix) {
+    const keys = [];
+    for (let offset = 0; ; offset += LIST_PAGE) {
+      const { data, error } = await this.client
+        .storage
+        .from(this.bucket)
+        .list(`${prefix}/`, { limit: LIST_PAGE, offset, sortBy: { column: 'name', order: 'asc' } });
+      if (error) throw error;
+      if (!data || !data.length) break;
+      keys.push(...data.map(f => `${prefix}/${f.name}`));
+      if (data.length < LIST_PAGE) break;
+    }
+    return keys;
+  }
+
+  async remove(keys) {
+    for (let i = 0; i < keys.length; i += LIST_PAGE) {
+      const { error } = await this.client.storage.from(this.bucket).remove(keys.slice(i, i + LIST_PAGE));
+      if (error) throw error;
+    }
+  }
+
+  async removePrefix(prefix) {
+    await this.remove(await this.list(prefix));
+  }
+
+  publicUrl(key) {
+    return `${process.env.SUPABASE_URL}/storage/v1/object/public/${this.bucket}/${key}`;
+  }
+}
+
+/** Dossier local qui remplace le bucket (tests, load-tests, dev hors-ligne). */
+class FsColdStore {
+  constructor(dir) {
+    this.dir = dir;
+    fs.mkdirSync(dir, { recursive: true });
+  }
+
+  async put(key, buffer) {
+    const p = path.join(this.dir, key);
+    if (fs.existsSync(p)) return;
+    await fs.promises.mkdir(path.dirname(p), { recursive: true });
+    await fs.promises.writeFile(`${p}.tmp`, buffer);
+    await fs.promises.rename(`${p}.tmp`, p);
+  }
+
+  async get(key) {
+    try {
+      return await fs.promises.readFile(path.join(this.dir, key));
+    } catch {
+      return null;
+    }
+  }
+
+  async list(prefix) {
+    try {
+      const names = await fs.promises.readdir(path.join(this.dir, String(prefix)));
+      return names.filter(n => !n.endsWith('.tmp')).map(n => `${prefix}/${n}`);
+    } catch {
+      return [];
+    }
+  }
+
+  async remove(keys) {
+    await Promise.all(keys.map(k => fs.promises.rm(path.join(this.dir, k), { force: true })));
+  }
+
+  async removePrefix(prefix) {
+    await fs.promises.rm(path.join(this.dir, String(prefix)), { recursive: true, force: true });
+  }
+
+  publicUrl() {
+    return null; // servi uniquement via /artifacts
+  }
+}
+
+// ---------------- Magasin à deux niveaux ----------------
+
+class ArtifactStore {
+  /**
+   * @param {{ hotDir: string, cold: SupabaseColdStore|FsColdStore, hotMaxBytes?: number }} opts
+   */
+  constructor({ hotDir, cold, hotMaxBytes = 0 }) {
+    this.hotDir = hotDir;
+    this.cold = cold;
+    this.hotMaxBytes = hotMaxBytes;
+    this.filling = new Map(); // clé → promesse de remplissage du niveau chaud
+    this.pruneTimer = null;
+    fs.mkdirSync(hotDir, { recursive: true });
+  }
+
+  hotPath(key) {
+    return path.join(this.hotDir, key);
+  }
+
+  /**
+   * Enregistre un fichier : niveau chaud (immédiat) + niveau froid.
+   * @param {string|number} beatId
+   * @param {string} filePath - fichier local (ex. temp/12_Main_A.wav)
+   * @returns {Promise<{key: string, etag: string, size: number}>}
+   */
+  async putFile(beatId, filePath) {
+    const buffer = await fs.promises.readFile(filePath);
+    const key = contentKey(beatId, path.basename(filePath), buffer);
+    await this.writeHot(key, buffer);
+    await this.cold.put(key, buffer, contentTypeFor(key));
+    this.schedulePrune();
+    return { key, etag: key.match(KEY_RE)[1], size: buffer.length };
+  }
+
+  /**
+   * Fin de re-rendu : supprime, aux deux niveaux, les versions précédentes (autre hash) des artefacts
+   * qui viennent d'être écrits. Le préfixe du beat n'est listé qu'une fois.
+   * @param {string|number} beatId
+   * @param {Iterable<string>} currentKeys - clés écrites par ce rendu
+   * @param {Set<string>} [keep] - clés encore référencées ailleurs (ex. manifest en cache) : conservées
+   * @returns {Promise<string[]>} clés supprimées
+   */
+  async removeSuperseded(beatId, currentKeys, keep = new Set()) {
+    const current = new Set(currentKeys);
+    if (!current.size) return [];
+    let hot = [];
+    try {
+      hot = (await fs.promises.readdir(path.join(this.hotDir, String(beatId)))).map(n => `${beatId}/${n}`);
+    } catch {}
+    const stale = [...new Set([...hot, ...(await this.cold.list(beatId))])]
+      .filter(k => !current.has(k) && !keep.has(k) && [...current].some(c => sameArtifact(k, c)));
+    if (!stale.length) return [];
+    await Promise.all(stale.map(k => fs.promises.rm(this.hotPath(k), { force: true })));
+    await this.cold.remove(stale);
+    return stale;
+  }
+
+  async writeHot(key, buffer) {
+    const p = this.hotPath(key);
+    if (fs.existsSync(p)) return;
+    await fs.promises.mkdir(path.dirname(p), { recursive: true });
+    const tmp = `${p}.${process.pid}.tmp`;
+    await fs.promises.writeFile(tmp, buffer);
+    await fs.promises.rename(tmp, p);
+  }
+
+  /**
+   * Lecture : niveau chaud, sinon niveau froid + remplissage asynchrone du niveau chaud.
+   * opts.skipHot : fichier chaud disparu entre-temps (éviction) → niveau froid directement.
+   * @returns {Promise<{hotPath?: string, buffer?: Buffer}|null>}
+   */
+  async read(key, { skipHot = false } = {}) {
+    const p = this.hotPath(key);
+    if (!skipHot && fs.existsSync(p)) {
+      const now = new Date();
+      fs.promises.utimes(p, now, now).catch(() => {}); // LRU sur mtime
+      return { hotPath: p };
+    }
+    const buffer = await this.cold.get(key);
+    if (!buffer) return null;
+    if (!this.filling.has(key)) {
+      const job = this.writeHot(key, buffer)
+        .then(() => this.schedulePrune())
+        .catch(e => console.warn(`⚠️ Remplissage niveau chaud ${key} :`, e.message))
+        .finally(() => this.filling.delete(key));
+      this.filling.set(key, job);
+    }
+    return { buffer };
+  }
+
+  /** URL publique : route /artifacts du serveur, ou URL directe du niveau froid. */
+  url(key, baseUrl) {
+    if (process.env.ARTIFACT_URLS === 'cold' && this.cold.publicUrl(key)) return this.cold.publicUrl(key);
+    return `${baseUrl}/artifacts/${key}`;
+  }
+
+  async removeBeat(beatId) {
+    await fs.promises.rm(path.join(this.hotDir, String(beatId)), { recursive: true, force: true });
+    await this.cold.removePrefix(String(beatId));
+  }
+
+  // Éviction du niveau chaud (plus ancien mtime d'abord) au-delà de hotMaxBytes
+  schedulePrune() {
+    if (!this.hotMaxBytes || this.pruneTimer) return;
+    this.pruneTimer = setTimeout(() => {
+      this.pruneTimer = null;
+      this.prune().catch(e => console.warn('⚠️ Éviction niveau chaud :', e.message));
+    }, 1000);
+    this.pruneTimer.unref?.();
+  }
+
+  async prune() {
+    const files = [];
+    for (const dir of await fs.promises.readdir(this.hotDir)) {
+      const d = path.join(this.hotDir, dir);
+      if (!(await fs.promises.stat(d)).isDirectory()) continue;
+      for (const f of await fs.promises.readdir(d)) {
+        if (f.endsWith('.tmp')) continue;
+        const st = await fs.promises.stat(path.join(d, f));
+        files.push({ p: path.join(d, f), size: st.size, mtime: st.mtimeMs });
+      }
+    }
+    let total = files.reduce((n, f) => n + f.size, 0);
+    files.sort((a, b) => a.mtime - b.mtime);
+    for (const f of files) {
+      if (total <= this.hotMaxBytes) break;
+      await fs.promises.unlink(f.p).catch(() => {});
+      total -= f.size;
+    }
+  }
+}
+
+// ---------------- Service HTTP (/artifacts/<clé>) ----------------
+
+function parseRange(header, size) {
+  const m = /^bytes=(\d*)-(\d*)$/.exec(header || '');
+  if (!m || (m[1] === '' && m[2] === '')) return null;
+  let start, end;
+  if (m[1] === '') {
+    start = Math.max(0, size - parseInt(m[2], 10));
+    end = size - 1;
+  } else {
+    start = parseInt(m[1], 10);
+    end = m[2] === '' ? size - 1 : Math.min(parseInt(m[2], 10), size - 1);
+  }
+  return start <= end && start < size ? { start, end } : 'unsatisfiable';
+}
+
+/**
+ * Middleware Express : sert une clé immuable (Cache-Control 1 an, ETag fort, Range).
+ * Niveau chaud → res.sendFile (Range / 304 gérés par express) ; sinon, ou si le fichier chaud
+ * a été évincé entre-temps (ENOENT), tampon du niveau froid.
+ */
+function serveArtifacts(store) {
+  return async (req, res, next) => {
+    if (req.method !== 'GET' && req.method !== 'HEAD') return next();
+    const key = decodeURIComponent(req.path.replace(/^\/+/, ''));
+    const m = KEY_RE.exec(key);
+    if (!m) return res.status(404).json({ error: 'Artefact introuvable' });
+
+    const etag = `"${m[1]}"`;
+    res.setHeader('ETag', etag);
+    res.setHeader('Cache-Control', `public, max-age=${IMMUTABLE_MAX_AGE}, immutable`);
+    res.setHeader('Content-Type', contentTypeFor(key));
+    res.setHeader('Accept-Ranges', 'bytes');
+
+    const sendBuffer = buf => {
+      const inm = req.headers['if-none-match'];
+      if (inm && inm.split(',').map(s => s.trim()).some(t => t === etag || t === `W/${etag}` || t === '*')) {
+        return res.status(304).end();
+      }
+      const range = req.headers.range && (!req.headers['if-range'] || req.headers['if-range'] === etag)
+        ? parseRange(req.headers.range, buf.length) : null;
+      if (range === 'unsatisfiable') {
+        res.setHeader('Content-Range', `bytes */${buf.length}`);
+        return res.status(416).end();
+      }
+      if (range) {
+        res.status(206);
+        res.setHeader('Content-Range', `bytes ${range.start}-${range.end}/${buf.length}`);
+        res.setHeader('Content-Length', range.end - range.start + 1);
+        return res.end(req.method === 'HEAD' ? undefined : buf.subarray(range.start, range.end + 1));
+      }
+      res.setHeader('Content-Length', buf.length);
+      return res.end(req.method === 'HEAD' ? undefined : buf);
+    };
+
+    const fromCold = async () => {
+      const hit = await store.read(key, { skipHot: true });
+      if (!hit) return res.status(404).json({ error: 'Artefact introuvable' });
+      return sendBuffer(hit.buffer);
+    };
+
+    try {
+      const hit = await store.read(key);
+      if (!hit) return res.status(404).json({ error: 'Artefact introuvable' });
+      if (!hit.hotPath) return sendBuffer(hit.buffer);
+
+      return res.sendFile(hit.hotPath, { etag: false, lastModified: false, cacheControl: false }, err => {
+        if (!err || res.headersSent) return;
+        // Évincé entre le stat et la lecture : repli sur le niveau froid
+        if (err.code === 'ENOENT') {
+          return fromCold().catch(e => {
+            console.error(`❌ Lecture artefact ${key} :`, e.message);
+            if (!res.headersSent) next(e);
+          });
+        }
+        next(err);
+      });
+    } catch (err) {
+      console.error(`❌ Lecture artefact ${key} :`, err.message);
+      return next(err);
+    }
+  };
+}
+
+// ---------------- Instance partagée ----------------
+
+let shared = null;
+
+/** Magasin configuré par l'environnement (ARTIFACT_HOT_DIR, ARTIFACT_HOT_MAX_MB, ARTIFACT_COLD_DIR). */
+function getArtifactStore() {
+  if (!shared) {
+    const root = path.join(__dirname, '..');
+    const cold = process.env.ARTIFACT_COLD_DIR
+      ? new FsColdStore(path.resolve(root, process.env.ARTIFACT_COLD_DIR))
+      : new SupabaseColdStore('midiAndWav');
+    shared = new ArtifactStore({
+      hotDir: path.resolve(root, process.env.ARTIFACT_HOT_DIR || 'cache/artifacts'),
+      cold,
+      hotMaxBytes: parseFloat(process.env.ARTIFACT_HOT_MAX_MB || '2048') * 1024 * 1024
+    });
+  }
+  return shared;
+}
+
+module.exports = {
+  ArtifactStore,
+  SupabaseColdStore,
+  FsColdStore,
+  contentKey,
+  parseRange,
+  serveArtifacts,
+  getArtifactStore,
+  IMMUTABLE_MAX_AGE
+};
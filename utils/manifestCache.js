@@ -0,0 +1,122 @@
+// utils/manifestCache.js
+// Manifests pleine qualité mis en cache sur disque, un fichier par beat (MANIFEST_CACHE_DIR) :
+//  - valides tant que le fichier, l'URL et le tempo du beat ne changent pas ;
+//  - URLs stockées relatives (/artifacts/…), résolues à chaque requête avec l'URL publique ;
+//  - invalidate() (nouveau .sty, éventuellement au même nom) supprime l'entrée et les fichiers
+//    temp/ du beat, et empêche un rendu démarré avant l'invalidation d'écrire un manifest périmé.
+const fs = require('fs');
+const path = require('path');
+
+const MANIFEST_CACHE_DIR = path.resolve(__dirname, '..', process.env.MANIFEST_CACHE_DIR || 'cache/manifests');
+const TEMP_DIR = path.join(__dirname, '..', 'temp');
+const ARTIFACT_KEY_IN_URL = /([\w-]+\/[\w.-]+\.[0-9a-f]{16}\.[a-z0-9]+)(?:\?.*)?$/i;
+
+const generations = new Map(); // beatId → compteur d'invalidations
+
+function cachePath(beatId) {
+  return Number.isInteger(Number(beatId)) ? path.join(MANIFEST_CACHE_DIR, `${Number(beatId)}.json`) : null;
+}
+
+function beatSourceKey(beat) {
+  return `${beat.filename}|${beat.url}|${beat.tempo}`;
+}
+
+/** Génération courante d'un beat : à relever avant l'extraction, à repasser à write(). */
+function generation(beatId) {
+  return generations.get(Number(beatId)) || 0;
+}
+
+// Applique fn à chaque URL d'un manifest (wavUrl, midiUrl, peaksUrl, stems[].wavUrl, sprite.url)
+function mapManifestUrls(value, fn) {
+  if (Array.isArray(value)) return value.map(v => mapManifestUrls(v, fn));
+  if (!value || typeof value !== 'object') return value;
+  return Object.fromEntries(Object.entries(value).map(([k, v]) =>
+    [k, typeof v === 'string' && (k === 'url' || k.endsWith('Url')) ? fn(v) : mapManifestUrls(v, fn)]));
+}
+
+/** Clés d'artefacts référencées par un manifest (null pour une URL hors magasin, ex. temp/). */
+function manifestArtifactKeys(manifest) {
+  const keys = [];
+  mapManifestUrls(manifest, u => { keys.push(ARTIFACT_KEY_IN_URL.exec(u)?.[1] || null); return u; });
+  return keys;
+}
+
+function readEntry(beatId) {
+  const p = cachePath(beatId);
+  if (!p) return null;
+  try {
+    return JSON.parse(fs.readFileSync(p, 'utf-8'));
+  } catch {
+    return null;
+  }
+}
+
+/**
+ * Manifest en cache pour ce beat, ou null.
+ * baseUrl : URL publique de la requête en cours ; sans baseUrl, URLs relatives telles que stockées.
+ */
+function read(beat, { wantStems, wantSprite, baseUrl = '' }) {
+  const c = readEntry(beat.id);
+  if (!c || c.source !== beatSourceKey(beat)) return null;
+  if ((wantStems && !c.stems) || (wantSprite && !c.sprite)) return null;
+  return mapManifestUrls(c.manifest, u => (u.startsWith('/') ? `${baseUrl}${u}` : u));
+}
+
+/** Clés d'artefacts du manifest en cache (quelle que soit sa validité) : à ne pas supprimer. */
+function referencedKeys(beatId) {
+  const c = readEntry(beatId);
+  return new Set(c ? manifestArtifactKeys(c.manifest).filter(Boolean) : []);
+}
+
+/** Écrit le manifest si toutes ses URLs sont des artefacts du magasin et si le beat n'a pas été invalidé entre-temps. */
+function write(beat, manifest, { wantStems, wantSprite, baseUrl = '', gen = generation(beat.id) }) {
+  const keys = manifestArtifactKeys(manifest);
+  if (!keys.length || keys.some(k => !k)) return false;
+  if (gen !== generation(beat.id)) {
+    console.warn(`⚠️ Manifest beatId=${beat.id} périmé (beat mis à jour pendant le rendu) : non mis en cache`);
+    return false;
+  }
+  try {
+    fs.mkdirSync(MANIFEST_CACHE_DIR, { recursive: true });
+    const p = cachePath(beat.id);
+    const stored = mapManifestUrls(manifest, u => (baseUrl && u.startsWith(`${baseUrl}/`) ? u.slice(baseUrl.length) : u));
+    const body = { source: beatSourceKey(beat), stems: !!wantStems, sprite: !!(wantSprite && manifest.sprite), manifest: stored };
+    fs.writeFileSync(`${p}.tmp`, JSON.stringify(body));
+    fs.renameSync(`${p}.tmp`, p);
+    return true;
+  } catch (e) {
+    console.warn('⚠️ Manifest non mis en cache :', e.message);
+    return false;
+  }
+}
+
+function drop(beatId) {
+  const p = cachePath(beatId);
+  if (p) try { fs.unlinkSync(p); } catch {}
+}
+
+/** .sty du beat remplacé : entrée et fichiers temp/ supprimés, rendus en cours empêchés d'écrire. */
+function invalidate(beatId) {
+  const id = Number(beatId);
+  if (!Number.isInteger(id)) return;
+  generations.set(id, generation(id) + 1);
+  drop(id);
+  try {
+    for (const f of fs.readdirSync(TEMP_DIR)) {
+      if (f.startsWith(`${id}_`)) fs.rmSync(path.join(TEMP_DIR, f), { force: true });
+    }
+  } catch {}
+}
+
+module.exports = {
+  MANIFEST_CACHE_DIR,
+  beatSourceKey,
+  generation,
+  mapManifestUrls,
+  manifestArtifactKeys,
+  read,
+  write,
+  drop,
+  invalidate,
+  referencedKeys
+};
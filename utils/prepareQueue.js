@@ -0,0 +1,174 @@
+// utils/prepareQueue.js
+// File de pré-rendu en tâche de fond (prepare-all-sections sans client en attente).
+//  - priorités : beat ouvert par un utilisateur > beat populaire > upload / mise à jour ;
+//  - dédoublonnage par beatId (un job ré-enfilé garde la meilleure priorité) ;
+//  - un beat ré-enfilé pendant son propre rendu (mise à jour) est marqué et relancé à la fin ;
+//  - bornée (PREWARM_MAX_QUEUE) : au-delà, le job le moins prioritaire est écarté ; à égalité
+//    avec le pire job en file, le nouveau est refusé (le plus ancien est gardé) ;
+//  - ne démarre rien tant que la charge CPU dépasse PREWARM_MAX_LOAD (loadavg / cœurs)
+//    ou qu'un rendu interactif est en cours (isBusy fourni par routes/player.js).
+const os = require('os');
+
+const PRIORITY = { OPENED: 0, POPULAR: 1, UPLOAD: 2 };
+
+class PrepareQueue {
+  /**
+   * @param {{ maxQueue?: number, maxLoad?: number, concurrency?: number, pollMs?: number, enabled?: boolean }} opts
+   */
+  constructor({ maxQueue = 200, maxLoad = 0.75, concurrency = 1, pollMs = 2000, enabled = true } = {}) {
+    this.maxQueue = maxQueue;
+    this.maxLoad = maxLoad;
+    this.concurrency = concurrency;
+    this.pollMs = pollMs;
+    this.enabled = enabled;
+    this.jobs = new Map();      // beatId → { beatId, priority, score, seq }
+    this.running = new Set();
+    this.dirty = new Map();     // beatId en cours de rendu → { priority, score } à relancer
+    this.seq = 0;
+    this.runner = null;
+    this.isBusy = () => false;
+    this.timer = null;
+    this.done = 0;
+    this.failed = 0;
+  }
+
+  /** runner(beatId) → Promise ; isBusy() → true si du travail interactif est en cours. */
+  setRunner(runner, isBusy) {
+    this.runner = runner;
+    if (isBusy) this.isBusy = isBusy;
+    this.pump();
+  }
+
+  /** Enfile (ou remonte) un beat ; false si refusé (désactivé, file pleine de jobs plus prioritaires). */
+  enqueue(beatId, priority = PRIORITY.UPLOAD, score = 0) {
+    if (!this.enabled) return false;
+    if (this.running.has(beatId)) {
+      // Le rendu en cours lit peut-être l'ancienne version : relancé dans finally
+      const d = this.dirty.get(beatId);
+      if (!d || priority < d.priority || (priority === d.priority && score > d.score)) {
+        this.dirty.set(beatId, { priority, score });
+      }
+      return true;
+    }
+    const cur = this.jobs.get(beatId);
+    if (cur) {
+      if (priority < cur.priority || (priority === cur.priority && score > cur.score)) {
+        cur.priority = priority;
+        cur.score = score;
+      }
+      return true;
+    }
+    if (this.jobs.size >= this.maxQueue) {
+      const worst = this.pick(true);
+      // seq: Infinity → une égalité avec le pire job compte comme moins prioritaire
+      if (!worst || this.compare({ priority, score, seq: Infinity }, worst) >= 0) return false;
+      this.jobs.delete(worst.beatId);
+    }
+    this.jobs.set(beatId, { beatId, priority, score, seq: this.seq++ });
+    this.pump();
+    return true;
+  }
+
+  /** Un utilisateur ouvre ce beat : passe devant les jobs de fond. */
+  promote(beatId) {
+    const job = this.jobs.get(beatId);
+    if (job) job.priority = PRIORITY.OPENED;
+    return !!job;
+  }
+
+  remove(beatId) {
+    this.dirty.delete(beatId);
+    return this.jobs.delete(beatId);
+  }
+
+  compare(a, b) {
+    return a.priority - b.priority || b.score - a.score || a.seq - b.seq;
+  }
+
+  pick(worst = false) {
+    let best = null;
+    for (const job of this.jobs.values()) {
+      if (!best || (worst ? this.compare(job, best) > 0 : this.compare(job, best) < 0)) best = job;
+    }
+    return best;
+  }
+
+  overloaded() {
+    const load = os.loadavg()[0] / Math.max(1, os.cpus().length);
+    return { cpu: load >= this.maxLoad, busy: !!this.isBusy(), load };
+  }
+
+  canRun() {
+    const o = this.overloaded();
+    return !o.cpu && !o.busy;
+  }
+
+  /** Attente entre deux sections d'un job de fond tant que le serveur est chargé (sauf job promu). */
+  async waitForCapacity(ctx = {}) {
+    while (!ctx.promoted && !this.canRun()) {
+      await new Promise(r => setTimeout(r, this.pollMs));
+    }
+  }
+
+  pump() {
+    if (!this.runner || !this.enabled) return;
+    while (this.running.size < this.concurrency && this.jobs.size) {
+      if (!this.canRun()) {
+        if (!this.timer) {
+          this.timer = setTimeout(() => { this.timer = null; this.pump(); }, this.pollMs);
+          this.timer.unref?.();
+        }
+        return;
+      }
+      const job = this.pick();
+      this.jobs.delete(job.beatId);
+      this.running.add(job.beatId);
+      Promise.resolve()
+        .then(() => this.runner(job.beatId))
+        .then(() => { this.done++; })
+        .catch(e => {
+          this.failed++;
+          console.error(`❌ Pré-rendu beatId=${job.beatId} :`, e.message);
+        })
+        .finally(() => {
+          this.running.delete(job.beatId);
+          const again = this.dirty.get(job.beatId);
+          this.dirty.delete(job.beatId);
+          if (again) this.enqueue(job.beatId, again.priority, again.score);
+          this.pump();
+        });
+    }
+  }
+
+  stats() {
+    const byPriority = { opened: 0, popular: 0, upload: 0 };
+    const names = Object.fromEntries(Object.entries(PRIORITY).map(([k, v]) => [v, k.toLowerCase()]));
+    for (const job of this.jobs.values()) byPriority[names[job.priority]]++;
+    return {
+      enabled: this.enabled,
+      queued: this.jobs.size,
+      byPriority,
+      running: [...this.running],
+      done: this.done,
+      failed: this.failed,
+      ...this.overloaded()
+    };
+  }
+}
+
+let shared = null;
+
+/** File partagée configurée par l'environnement (PREWARM, PREWARM_MAX_QUEUE, PREWARM_MAX_LOAD, PREWARM_CONCURRENCY). */
+function getPrepareQueue() {
+  if (!shared) {
+    shared = new PrepareQueue({
+      enabled: (process.env.PREWARM || '1') !== '0',
+      maxQueue: parseInt(process.env.PREWARM_MAX_QUEUE || '200', 10),
+      maxLoad: parseFloat(process.env.PREWARM_MAX_LOAD || '0.75'),
+      concurrency: parseInt(process.env.PREWARM_CONCURRENCY || '1', 10)
+    });
+  }
+  return shared;
+}
+
+module.exports = { PrepareQueue, PRIORITY, getPrepareQueue };